@@ -3,7 +3,8 @@ load_dotenv(".envrc")
 
 import os, logging
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
-from src.telegram_handlers import handle_audio, handle_text, start, reset, error_handler, post_init, post_shutdown
+from src.telegram_handlers import handle_audio, handle_text, start, reset, stats, error_handler, post_init, post_shutdown
+from src.tools import load_tools
 
 # Logging-Konfiguration für Debugging
 logging.basicConfig(
@@ -13,6 +14,9 @@ logging.basicConfig(
 
 def main():
 
+    # Alle Tools laden und in der TOOLBOX registrieren
+    load_tools()
+
     # Erstellen des Telegram-Bots mit dem Application-Builder
     application = (Application.builder()
                 .token(os.getenv("TELEGRAM_BOT_TOKEN"))
@@ -23,6 +27,7 @@ def main():
     # Hinzufügen der Audio- und Text-Handler
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("reset", reset))
+    application.add_handler(CommandHandler("stats", stats))
     application.add_handler(MessageHandler(filters.VOICE, handle_audio))
     application.add_handler(
         MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text)
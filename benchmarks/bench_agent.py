@@ -0,0 +1,165 @@
+"""
+Benchmark für generate_chat_response und die Telegram-Handler mit aufgezeichneten Fixtures.
+Läuft komplett offline - OpenAI und alle Tools werden durch benchmarks/replay.py ersetzt.
+
+    python -m benchmarks.bench_agent [--iterations 50] [--latency 0.0]
+
+Pro Szenario werden gemessen:
+- Latenz pro Turn (Median und p95, ohne Tracing gemessen)
+- Netto neu allokierte Speicherblöcke und Spitzenverbrauch pro Turn (tracemalloc)
+- Größe des messages-Payloads der letzten Anfrage und der mitgesendeten Tool-Schemas in Bytes
+"""
+
+import os, sys, json, time, shutil, asyncio, logging, argparse, tempfile, datetime, functools, statistics, tracemalloc
+from types import SimpleNamespace
+
+
+BENCH_USER_ID = 4711
+
+
+def prepare_environment():
+    """Arbeitsverzeichnis und Umgebungsvariablen so setzen, dass die Module offline importierbar sind."""
+    os.environ.setdefault("OPENAI_API_KEY", "replay")
+    os.environ.setdefault("ALLOWED_TELEGRAM_USER_IDS", str(BENCH_USER_ID))
+    os.environ.setdefault("METRICS_PORT", "0")
+    os.environ.setdefault("STREAM_EDIT_INTERVAL", "0.2")
+    # Jede Nachricht ist ein eigener Turn - ohne Wartezeit für das Zusammenfassen
+    os.environ.setdefault("MAILBOX_DEBOUNCE_SECONDS", "0")
+
+    # Tool-Module lesen und schreiben relativ zum Arbeitsverzeichnis (database/...)
+    fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+    workdir = tempfile.mkdtemp(prefix="house-chat-bench-")
+    os.makedirs(os.path.join(workdir, "database"))
+    shutil.copy(
+        os.path.join(fixtures_dir, "abfuhrtermine.ics"),
+        os.path.join(workdir, "database", f"abfuhrtermine-{datetime.datetime.now().year}.ics")
+    )
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(workdir)
+    return workdir
+
+
+def payload_size(request):
+    """Größe von messages und tools einer Anfrage als JSON in Bytes."""
+    def default(obj):
+        return obj.model_dump(exclude_none=True)
+    messages = len(json.dumps(request["messages"], default=default, ensure_ascii=False).encode())
+    tools = len(json.dumps(request.get("tools", []), ensure_ascii=False).encode())
+    return messages, tools
+
+
+class FakeMessage:
+    """Minimaler Ersatz für telegram.Message mit den Methoden, die die Handler nutzen."""
+
+    def __init__(self, chat_id, text=None, voice=None):
+        self.chat_id = chat_id
+        self.text = text
+        self.voice = voice
+        self.replies = []
+        self.edits = 0
+
+    async def reply_text(self, text, parse_mode=None):
+        reply = FakeMessage(self.chat_id, text)
+        self.replies.append(reply)
+        return reply
+
+    async def edit_text(self, text, parse_mode=None):
+        self.text = text
+        self.edits += 1
+        return self
+
+
+class FakeVoice:
+
+    duration = 2
+
+    async def get_file(self):
+        return self
+
+    async def download_as_bytearray(self):
+        return bytearray(b"OggS" + bytes(2048))
+
+
+def summarise(label, latencies, blocks, peaks, sizes):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    return (
+        f"{label:<28} {statistics.median(latencies) * 1000:>9.2f} {p95 * 1000:>9.2f} "
+        f"{statistics.median(blocks):>9.0f} {statistics.median(peaks) / 1024:>9.1f} "
+        f"{sizes[0]:>9} {sizes[1]:>9}"
+    )
+
+
+async def measure(run, iterations):
+    """Führt run() aus: erst ohne Tracing für die Latenz, dann mit tracemalloc für die Allokationen."""
+    latencies, blocks, peaks = [], [], []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await run()
+        latencies.append(time.perf_counter() - started)
+
+    for _ in range(max(1, iterations // 5)):
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        await run()
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        blocks.append(sum(stat.count_diff for stat in after.compare_to(before, "filename")))
+        peaks.append(peak)
+    return latencies, blocks, peaks
+
+
+async def main(iterations, latency):
+    import src.ai_responses as ai_responses
+    import src.telegram_handlers as telegram_handlers
+    from src.telegram_user_data import reset_history
+    from src.ai_prompts import get_sysprompt
+    from src.chat_history import ChatHistory
+    from src.telegram_mailbox import MAILBOXES
+    from benchmarks.replay import ReplayClient, build_replay_toolbox, load_scenarios
+
+    client = ReplayClient(latency=latency)
+    toolbox = build_replay_toolbox()
+    ai_responses.client = client
+    # Die Handler sollen die aufgezeichneten Tools statt der echten TOOLBOX verwenden
+    telegram_handlers.generate_chat_response = functools.partial(ai_responses.generate_chat_response, toolbox=toolbox)
+
+    print(f"{'scenario':<28} {'p50 ms':>9} {'p95 ms':>9} {'blocks':>9} {'peak KiB':>9} {'msg B':>9} {'tools B':>9}")
+    for scenario in load_scenarios():
+
+        async def run_agent():
+            client.load(scenario)
+            user_data = {"user_id": BENCH_USER_ID, "chat_history": ChatHistory([{"role": "system", "content": get_sysprompt()}])}
+            await ai_responses.generate_chat_response(scenario["prompt"], user_data, toolbox=toolbox)
+
+        async def run_handler():
+            client.load(scenario)
+            await reset_history(BENCH_USER_ID)
+            if "transcription" in scenario:
+                message = FakeMessage(BENCH_USER_ID, voice=FakeVoice())
+                await telegram_handlers.handle_audio(SimpleNamespace(message=message), None)
+            else:
+                message = FakeMessage(BENCH_USER_ID, text=scenario["prompt"])
+                await telegram_handlers.handle_text(SimpleNamespace(message=message), None)
+            # Die Handler stellen die Nachricht nur in die Mailbox des Nutzers
+            await MAILBOXES[BENCH_USER_ID].join()
+
+        results = await measure(run_agent, iterations)
+        print(summarise(f"{scenario['name']} (agent)", *results, payload_size(client.requests[-1])))
+
+        results = await measure(run_handler, iterations)
+        handler = "audio" if "transcription" in scenario else "text"
+        print(summarise(f"{scenario['name']} ({handler})", *results, payload_size(client.requests[-1])))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark for the agent loop and Telegram handlers")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated provider latency per request in seconds")
+    args = parser.parse_args()
+
+    prepare_environment()
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(main(args.iterations, args.latency))
@@ -0,0 +1,95 @@
+"""
+Speicherbedarf und Aufbereitungszeit des Chatverlaufs pro 1000 Nachrichten.
+
+    python -m benchmarks.bench_history_memory [--messages 1000]
+
+Verglichen werden der bisherige Verlauf (dicts und ChatCompletionMessages der OpenAI-Bibliothek)
+und ChatHistory mit ChatMessages. Die Nachrichten stammen aus den aufgezeichneten Szenarien
+in benchmarks/fixtures, die Tool-Ergebnisse wiederholen sich also wie im echten Betrieb.
+"idle" ist der Verlauf zwischen zwei Turns, "in turn" inklusive der für die Anfragen
+zwischengespeicherten dicts, die nach dem Turn wieder freigegeben werden.
+"""
+
+import os, sys, time, argparse, tracemalloc
+
+
+def build_messages(count):
+    """Wiederholt die Nachrichten der aufgezeichneten Szenarien, bis count Nachrichten erreicht sind."""
+    from openai.types.chat import ChatCompletionMessage
+    from benchmarks.replay import load_fixture, load_scenarios, TOOLS_FIXTURE
+
+    tools = load_fixture(TOOLS_FIXTURE)
+    turn = []
+    for scenario in load_scenarios():
+        turn.append({"role": "user", "content": scenario["prompt"]})
+        for completion in scenario["completions"]:
+            message = completion["choices"][0]["message"]
+            turn.append(("assistant", message))
+            for tc in message.get("tool_calls") or []:
+                name = tc["function"]["name"]
+                turn.append({"role": "tool", "tool_call_id": tc["id"], "name": name, "content": str(tools[name]["result"])})
+
+    messages = []
+    while len(messages) < count:
+        for entry in turn[:count - len(messages)]:
+            if isinstance(entry, tuple):
+                # Wie im Agent-Loop: jede Antwort ist ein eigenes Objekt der OpenAI-Bibliothek
+                messages.append(ChatCompletionMessage.model_validate(entry[1]))
+            else:
+                # Tool-Ergebnisse entstehen per str() bei jedem Aufruf neu
+                messages.append({key: (value + " ")[:-1] if isinstance(value, str) else value for key, value in entry.items()})
+    return messages
+
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return result, sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+
+def time_payload(payload, iterations=20):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        payload()
+    return (time.perf_counter() - started) / iterations
+
+
+def main(count):
+    from src.chat_history import ChatHistory, to_payload
+
+    raw = build_messages(count)
+
+    # Bisher: die Objekte wie sie entstehen, bei jeder Anfrage erneut von der Bibliothek serialisiert
+    before, before_bytes = measure(lambda: build_messages(count))
+    before_time = time_payload(lambda: [m if isinstance(m, dict) else m.model_dump(exclude_none=True) for m in before])
+
+    history, after_bytes = measure(lambda: ChatHistory(build_messages(count), token_budget=10 ** 9))
+
+    def build_with_payload():
+        cached = ChatHistory(build_messages(count), token_budget=10 ** 9)
+        to_payload(cached)
+        return cached
+    _, cached_bytes = measure(build_with_payload)
+
+    # Erste Anfrage erzeugt die dicts, jede weitere im selben Turn verwendet sie wieder
+    first_time = time_payload(lambda: to_payload(history), iterations=1)
+    after_time = time_payload(lambda: to_payload(history))
+
+    scale = 1000 / len(raw)
+    print(f"{'representation':<34} {'KiB/1k msgs':>12} {'payload ms':>11}")
+    print(f"{'dicts + ChatCompletionMessage':<34} {before_bytes * scale / 1024:>12.1f} {before_time * 1000:>11.2f}")
+    print(f"{'ChatHistory[ChatMessage] (idle)':<34} {after_bytes * scale / 1024:>12.1f} {first_time * 1000:>11.2f}")
+    print(f"{'ChatHistory[ChatMessage] (in turn)':<34} {cached_bytes * scale / 1024:>12.1f} {after_time * 1000:>11.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory per 1k chat history messages")
+    parser.add_argument("--messages", type=int, default=1000)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "replay")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main(args.messages)
@@ -0,0 +1,73 @@
+"""
+Startzeit und Speicherbedarf beim Laden der Tools: alle Module importieren vs. Manifest.
+
+    python -m benchmarks.bench_startup [--runs 3]
+
+Jeder Lauf startet einen frischen Interpreter, der die Tool-Registry aufbaut, und misst die
+Zeit für load_tools, den maximalen RSS des Prozesses und die Anzahl geladener Module.
+"cold" baut das Manifest neu auf (erster Start nach einer Änderung), "warm" liest es nur.
+Zum Vergleich wird der erste Aufruf eines Tools gemessen, der beim Manifest das Modul nachlädt.
+Benötigt die Dateien in database/, die die Tool-Module beim Import lesen (z.B. den Abfuhrkalender).
+"""
+
+import os, sys, json, argparse, statistics, subprocess, tempfile
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Läuft im Kindprozess; Ergebnis als JSON auf stdout
+CHILD = r'''
+import os, sys, json, time, asyncio, logging, resource
+logging.disable(logging.CRITICAL)
+started = time.perf_counter()
+from src.tools import load_tools
+from src.toolbox.toolbox import TOOLBOX
+load_tools(lazy=sys.argv[1] != "eager", manifest_path=sys.argv[2])
+startup = time.perf_counter() - started
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+modules = len(sys.modules)
+
+started = time.perf_counter()
+try:
+    asyncio.run(TOOLBOX.get(sys.argv[3]).invoke({}))
+except Exception:
+    pass
+first_call = time.perf_counter() - started
+print(json.dumps({"startup": startup, "rss": rss, "modules": modules, "tools": len(TOOLBOX), "first_call": first_call}))
+'''
+
+
+def run(mode, manifest, tool):
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "bench"))
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, mode, manifest, tool], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(runs, tool):
+    with tempfile.TemporaryDirectory() as directory:
+        manifest = os.path.join(directory, "tool_manifest.json")
+        results = {"eager": [], "manifest (cold)": [], "manifest (warm)": []}
+        for _ in range(runs):
+            results["eager"].append(run("eager", manifest, tool))
+            if os.path.exists(manifest):
+                os.remove(manifest)
+            results["manifest (cold)"].append(run("lazy", manifest, tool))
+            results["manifest (warm)"].append(run("lazy", manifest, tool))
+
+    print(f"{'mode':<18} {'tools':>6} {'startup ms':>11} {'RSS MiB':>8} {'modules':>8} {'1st call ms':>12}")
+    for mode, samples in results.items():
+        median = lambda key: statistics.median(sample[key] for sample in samples)
+        print(
+            f"{mode:<18} {samples[0]['tools']:>6} {median('startup') * 1000:>11.0f} {median('rss') / 1024:>8.1f} "
+            f"{median('modules'):>8.0f} {median('first_call') * 1000:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup time and RSS of eager vs. manifest-based tool loading")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--tool", default="get_todays_trash", help="tool whose first call is measured")
+    args = parser.parse_args()
+    main(args.runs, args.tool)
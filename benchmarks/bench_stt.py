@@ -0,0 +1,55 @@
+"""
+Vergleicht die Latenz der Transkriptions-Backends aus src/speech_to_text.py an echten Sprachnachrichten.
+
+    python -m benchmarks.bench_stt clip1.ogg [clip2.ogg ...] [--iterations 5] [--backends local,remote]
+
+Das remote-Backend benötigt OPENAI_API_KEY (.envrc), das lokale faster-whisper.
+Pro Backend wird der erste Aufruf (beim lokalen Backend inkl. Laden des Modells) getrennt
+von den folgenden Aufrufen (Median und Maximum) ausgewiesen.
+"""
+
+import os, sys, time, asyncio, logging, argparse, statistics
+
+
+async def time_backend(backend, audio_file_data, iterations):
+    latencies, text = [], ""
+    for _ in range(max(1, iterations) + 1):
+        started = time.perf_counter()
+        text = await backend(audio_file_data)
+        latencies.append(time.perf_counter() - started)
+    return latencies[0], latencies[1:], text
+
+
+async def main(paths, iterations, backends):
+    import src.speech_to_text as stt
+
+    available = {"local": stt.transcribe_local, "remote": stt.transcribe_remote}
+    print(f"{'clip':<28} {'backend':<8} {'first ms':>9} {'p50 ms':>9} {'max ms':>9}  text")
+    for path in paths:
+        with open(path, "rb") as file:
+            audio_file_data = file.read()
+        for name in backends:
+            try:
+                first, latencies, text = await time_backend(available[name], audio_file_data, iterations)
+            except Exception as e:
+                print(f"{os.path.basename(path):<28} {name:<8} failed: {e}")
+                continue
+            print(
+                f"{os.path.basename(path):<28} {name:<8} {first * 1000:>9.0f} "
+                f"{statistics.median(latencies) * 1000:>9.0f} {max(latencies) * 1000:>9.0f}  {text[:40]}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency comparison of the speech-to-text backends")
+    parser.add_argument("paths", nargs="+", help="audio files, e.g. voice notes exported from Telegram (.ogg)")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--backends", default="local,remote")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv(".envrc")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(main(args.paths, args.iterations, args.backends.split(",")))
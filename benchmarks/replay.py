@@ -0,0 +1,226 @@
+"""
+Offline-Ersatz für OpenAI und die Tools, um generate_chat_response und die Telegram-Handler
+ohne Zugriff auf OpenAI, EVCC, OpenWeather usw. zu benchmarken.
+
+- ReplayClient spielt aufgezeichnete Chat-Completions (auch mit mehreren Tool-Calls) wieder ab,
+  wahlweise als normale Antwort oder als Stream.
+- build_replay_toolbox baut aus fixtures/tools.json eine ToolRegistry mit den echten Schemas,
+  deren Tools die aufgezeichneten Ergebnisse liefern.
+
+Neue Szenarien lassen sich mit echter Umgebung (.envrc) aufzeichnen:
+
+    python -m benchmarks.replay record <name> "<prompt>"
+"""
+
+import os, sys, json, asyncio, inspect
+from collections import deque
+from types import SimpleNamespace
+from typing import Annotated, Optional
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from src.toolbox.toolbox import Tool, ToolRegistry
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+COMPLETIONS_FIXTURE = os.path.join(FIXTURES_DIR, "completions.json")
+TOOLS_FIXTURE = os.path.join(FIXTURES_DIR, "tools.json")
+
+# Größe der Textstücke, in die eine aufgezeichnete Antwort beim Streamen zerlegt wird
+STREAM_PIECE_LENGTH = 12
+
+JSON_TYPES = {"string": str, "integer": int, "number": float, "boolean": bool}
+
+
+def load_fixture(path):
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def load_scenarios(path=COMPLETIONS_FIXTURE):
+    return load_fixture(path)["scenarios"]
+
+
+def completion_to_chunks(completion, piece_length=STREAM_PIECE_LENGTH):
+    """Zerlegt eine aufgezeichnete Completion in Stream-Chunks, wie sie die API mit stream=True liefert."""
+    message = completion["choices"][0]["message"]
+    base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"], "model": completion["model"]}
+
+    def chunk(delta, finish_reason=None):
+        return ChatCompletionChunk.model_validate(dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": finish_reason}]))
+
+    chunks = [chunk({"role": "assistant"})]
+    content = message.get("content") or ""
+    for i in range(0, len(content), piece_length):
+        chunks.append(chunk({"content": content[i:i + piece_length]}))
+    for index, tc in enumerate(message.get("tool_calls") or []):
+        arguments = tc["function"]["arguments"]
+        chunks.append(chunk({"tool_calls": [{"index": index, "id": tc["id"], "type": "function",
+                                             "function": {"name": tc["function"]["name"], "arguments": ""}}]}))
+        for i in range(0, len(arguments), piece_length):
+            chunks.append(chunk({"tool_calls": [{"index": index, "function": {"arguments": arguments[i:i + piece_length]}}]}))
+    chunks.append(chunk({}, completion["choices"][0]["finish_reason"]))
+    chunks.append(ChatCompletionChunk.model_validate(dict(base, choices=[], usage=completion.get("usage"))))
+    return chunks
+
+
+class ReplayStream:
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class ReplayCompletions:
+
+    def __init__(self, client):
+        self.client = client
+
+    async def create(self, **kwargs):
+        self.client.requests.append(kwargs)
+        if self.client.latency:
+            await asyncio.sleep(self.client.latency)
+
+        # Anfragen ohne Tools sind Zusammenfassungen des Chatverlaufs - die gehören nicht zum Szenario
+        if "tools" not in kwargs:
+            completion = self.client.summary_completion()
+        else:
+            if not self.client.queue:
+                raise RuntimeError("No recorded completion left for this request")
+            completion = self.client.queue.popleft()
+
+        if kwargs.get("stream"):
+            return ReplayStream(completion_to_chunks(completion))
+        return ChatCompletion.model_validate(completion)
+
+
+class ReplayTranscriptions:
+
+    def __init__(self, client):
+        self.client = client
+
+    async def create(self, **kwargs):
+        if self.client.latency:
+            await asyncio.sleep(self.client.latency)
+        return SimpleNamespace(text=self.client.transcription)
+
+
+class ReplayClient:
+    """
+    OpenAI-kompatibler Ersatz für openai.AsyncOpenAI, der aufgezeichnete Antworten abspielt.
+    Jede Anfrage wird in requests festgehalten, um z.B. die Größe des Payloads zu messen.
+    latency simuliert die Antwortzeit des Providers pro Anfrage in Sekunden.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.queue = deque()
+        self.transcription = ""
+        self.requests = []
+        self.chat = SimpleNamespace(completions=ReplayCompletions(self))
+        self.audio = SimpleNamespace(transcriptions=ReplayTranscriptions(self))
+
+    def load(self, scenario):
+        """Stellt die Completions eines Szenarios für die nächsten Anfragen bereit."""
+        self.queue = deque(scenario["completions"])
+        self.transcription = scenario.get("transcription", scenario["prompt"])
+        self.requests = []
+
+    def summary_completion(self):
+        return {
+            "id": "chatcmpl-replay-summary", "object": "chat.completion", "created": 0, "model": "replay",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "Bisher nur Smalltalk."}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+
+def replay_tool(name, spec):
+    """Tool mit dem aufgezeichneten Schema, das immer das aufgezeichnete Ergebnis liefert."""
+
+    async def replay(**kwargs):
+        return spec["result"]
+
+    replay.__name__ = name
+    # Signatur aus dem Schema, damit die Argument-Konvertierung der Registry wie beim echten Tool greift
+    properties = spec["schema"]["function"]["parameters"]["properties"]
+    replay.__signature__ = inspect.Signature([
+        inspect.Parameter(param, inspect.Parameter.KEYWORD_ONLY, default=None,
+                          annotation=Annotated[Optional[JSON_TYPES.get(prop["type"], str)], prop["description"]])
+        for param, prop in properties.items()
+    ])
+    return Tool(replay, spec["schema"], spec.get("keywords"))
+
+
+def build_replay_toolbox(path=TOOLS_FIXTURE):
+    toolbox = ToolRegistry()
+    for name, spec in load_fixture(path).items():
+        toolbox.register(replay_tool(name, spec))
+    return toolbox
+
+
+async def record(name, prompt):
+    """
+    Führt einen Prompt gegen das echte Modell und die echten Tools aus und speichert
+    Completions und Tool-Ergebnisse als Fixtures. Benötigt die vollständige Umgebung (.envrc).
+    """
+    import src.ai_responses as ai_responses
+    from src.tools import load_tools
+    from src.toolbox.toolbox import TOOLBOX
+    from src.ai_prompts import get_sysprompt
+
+    # Alle Tools echt importieren, damit ihre Funktionen aufgezeichnet werden können
+    load_tools(lazy=False)
+    completions, tool_results = [], dict()
+
+    create = ai_responses.client.chat.completions.create
+
+    async def recording_create(**kwargs):
+        response = await create(**kwargs)
+        if "tools" in kwargs:
+            completions.append(response.model_dump(mode="json"))
+        return response
+
+    ai_responses.client.chat.completions.create = recording_create
+    for tool in TOOLBOX:
+        def wrap(tool, func):
+            async def recording_func(**kwargs):
+                result = await func(**kwargs) if tool.is_async else func(**kwargs)
+                tool_results[tool.name] = result
+                return result
+            return recording_func
+        tool.func, tool.is_async = wrap(tool, tool.func), True
+
+    user_data = {"user_id": 0, "chat_history": [{"role": "system", "content": get_sysprompt()}]}
+    await ai_responses.generate_chat_response(prompt, user_data)
+
+    fixture = load_fixture(COMPLETIONS_FIXTURE)
+    fixture["scenarios"] = [s for s in fixture["scenarios"] if s["name"] != name]
+    fixture["scenarios"].append({"name": name, "prompt": prompt, "completions": completions})
+    with open(COMPLETIONS_FIXTURE, "w") as file:
+        json.dump(fixture, file, ensure_ascii=False, indent=2)
+
+    tools = load_fixture(TOOLS_FIXTURE)
+    for tool in TOOLBOX:
+        spec = tools.setdefault(tool.name, {"result": ""})
+        spec["schema"] = tool.schema
+        spec["keywords"] = tool.keywords
+        if tool.name in tool_results:
+            spec["result"] = tool_results[tool.name]
+    with open(TOOLS_FIXTURE, "w") as file:
+        json.dump(tools, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "record":
+        print('Usage: python -m benchmarks.replay record <name> "<prompt>"')
+        sys.exit(1)
+
+    from dotenv import load_dotenv
+    load_dotenv(".envrc")
+    asyncio.run(record(sys.argv[2], sys.argv[3]))
@@ -1,9 +1,12 @@
-import os, io, json, asyncio, logging
-import openai
+import os, io, json, time, asyncio, logging, datetime
+import openai, pytz
+from openai.types.chat import ChatCompletionMessage
 
-from src.toolbox.toolbox import TOOLBOX
-
-import src.tools
+from src.toolbox.toolbox import TOOLBOX, ToolArgumentError, ToolUnavailableError
+from src.toolbox.tool_selector import select_tools
+from src.chat_history import ChatHistory, to_payload
+from src.ai_prompts import get_summary_prompt, get_time_prompt
+from src.metrics import TurnMetrics
 
 
 logging.basicConfig(
@@ -21,80 +24,199 @@ model = "gpt-4.1-mini-2025-04-14"
 # o1 models do not support tool-calling up to now
 # model = "o1-mini"
 
+# Günstiges Modell für die Zusammenfassung älterer Chatverläufe
+summary_model = "gpt-4.1-mini-2025-04-14"
+
+# Maximale Anzahl gleichzeitig laufender Tool-Calls innerhalb eines Turns
+MAX_PARALLEL_TOOL_CALLS = int(os.getenv("MAX_PARALLEL_TOOL_CALLS", "4"))
+
+
+async def call_tool(tc, user_id, toolbox, semaphore):
+    """Führt einen einzelnen Tool-Call aus und liefert die passende tool-Nachricht."""
+    tool_call_id = tc.id
+    tool_call_name = tc.function.name
+    func_response = None
+
+    async with semaphore:
+        try:
+            func_args = json.loads(tc.function.arguments) if tc.function.arguments else {}
+
+            logging.info(f"Function name: {tool_call_name}")
+            logging.info(f"Function arguments before resetting user_id: {func_args}")
+            if "user_id" in func_args.keys():
+                func_args["user_id"] = user_id
+            logging.info(f"Function arguments after setting user_id: {func_args}")
+
+            tool = toolbox.get(tool_call_name)
+            if tool is None:
+                raise ToolArgumentError(f"Unknown function: {tool_call_name}")
+            func_response = await tool.invoke(func_args)
+
+        except (ToolArgumentError, ToolUnavailableError) as e:
+            logging.error(str(e))
+            func_response = str(e)
+        except json.JSONDecodeError as e:
+            logging.error(f"Invalid arguments for function: {tool_call_name} with error: {e}")
+            func_response = str("The function arguments were not valid JSON.")
+        except Exception as e:
+            logging.error(f"Failed to call function: {tool_call_name} with error: {e}")
+            func_response = str("An Exception occurred while calling the function.")
+        finally:
+            logging.info("Function response: " + str(func_response))
+
+    return {
+        "role": "tool",
+        "tool_call_id": tool_call_id,
+        "name": tool_call_name,
+        "content": str(func_response),
+    }
+
+
+async def summarise_history(text):
+    """Verdichtet ältere Chat-Turns zu einer kurzen Zusammenfassung."""
+    response = await client.chat.completions.create(
+        model=summary_model,
+        messages=[
+            {"role": "system", "content": get_summary_prompt()},
+            {"role": "user", "content": text}
+        ],
+        max_tokens=500
+    )
+    return response.choices[0].message.content
+
 
-async def generate_chat_response(prompt, user_data, toolbox=TOOLBOX):
-    """Generiert eine Antwort auf eine Textnachricht mit dem OpenAI Modell."""
+async def stream_chat_completion(messages, tools, on_text):
+    """
+    Fordert eine Completion mit stream=True an und setzt Text- und Tool-Call-Deltas zusammen.
+    on_text wird bei jedem neuen Textstück mit dem bisher vollständigen Text aufgerufen.
+    Liefert eine ChatCompletionMessage wie im nicht-streamenden Fall und die Token-Usage.
+    """
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        tools=tools,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+
+    content_parts = []
+    tool_calls = dict()  # index -> zusammengesetzter Tool-Call
+    usage = None
+    async for chunk in stream:
+        # Der letzte Chunk enthält nur die Usage und keine choices
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+
+        if delta.content:
+            content_parts.append(delta.content)
+            await on_text("".join(content_parts))
+
+        # Tool-Calls kommen in Fragmenten: id und name im ersten Delta, die Argumente verteilt
+        for tc in delta.tool_calls or []:
+            entry = tool_calls.setdefault(tc.index, {
+                "id": None,
+                "type": "function",
+                "function": {"name": "", "arguments": ""},
+            })
+            if tc.id:
+                entry["id"] = tc.id
+            if tc.function is not None:
+                if tc.function.name:
+                    entry["function"]["name"] += tc.function.name
+                if tc.function.arguments:
+                    entry["function"]["arguments"] += tc.function.arguments
+
+    message = ChatCompletionMessage.model_validate({
+        "role": "assistant",
+        "content": "".join(content_parts) if content_parts else None,
+        "tool_calls": [tool_calls[index] for index in sorted(tool_calls)] if tool_calls else None,
+    })
+    return message, usage
+
+
+def get_time_message():
+    """Kleine, veränderliche Nachricht mit Datum und Uhrzeit - wird nur ans Ende der Anfrage gehängt."""
+    now = datetime.datetime.now(tz=pytz.timezone("Europe/Berlin"))
+    return {"role": "system", "content": get_time_prompt(now.strftime("%Y-%m-%d"), now.strftime("%H:%M"))}
+
+
+async def generate_chat_response(prompt, user_data, toolbox=TOOLBOX, on_text=None):
+    """
+    Generiert eine Antwort auf eine Textnachricht mit dem OpenAI Modell.
+    Wird on_text übergeben, wird die Antwort gestreamt und on_text mit dem bisherigen Text aufgerufen.
+    """
 
     user_id = user_data["user_id"]
 
     chat_history = user_data["chat_history"]
-
-    # TODO: hier könnte tool filtering stattfinden
-    tools = [tool for (_, tool, _) in toolbox]
-
-    chat_history.append({"role": "user", "content": prompt})
-
-    # # for o1 models, there is no system prompt - replace it with user
-    # if model.startswith("o1"):
-    #     for item in chat_history:
-    #         if item["role"] == "system":
-    #             item["role"] = "user"
-
-    while True:
-        response = await client.chat.completions.create(
-            model=model,
-            messages=chat_history,
-            tools=tools
-        )
-        chat_history.append(response.choices[0].message)
-
-        # if no tool is needed, break and return response
-        if response.choices[0].message.tool_calls is None:
-            break
-
-        for tc in response.choices[0].message.tool_calls:
-            if tc.id:  # New tool call detected here
-                tool_call_id = tc.id
-                tool_call_name = tc.function.name
-            tool_call_accumulator = tc.function.arguments if tc.function.arguments else ""
-        
-            # When the accumulated JSON string seems complete then:
-            try:
-                func_args = json.loads(tool_call_accumulator)
-
-                logging.info(f"Function name: {tool_call_name}")
-                logging.info(f"Function arguments before resetting user_id: {func_args}")
-                if "user_id" in func_args.keys():
-                    func_args["user_id"] = user_id
-                logging.info(f"Function arguments after setting user_id: {func_args}")
-
-                try: # find in toolbox the function that matches the tool_call_name and execute it
-                    func = next((func for (fname, _, func) in toolbox if fname == tool_call_name), None)
-                    if asyncio.iscoroutinefunction(func):
-                        func_response = await func(**func_args)
-                    else:
-                        func_response = func(**func_args)
-
-                except Exception as e:
-                    logging.error(f"Failed to call function: {tool_call_name} with error: {e}")
-                    func_response = str("An Exception occurred while calling the function.")
-                finally:
-                    logging.info("Function response: " + str(func_response))
-                    # Append the function response directly to messages
-                    chat_history.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call_id,
-                        "name": tool_call_name,
-                        "content": str(func_response),
-                    })
-                tool_call_accumulator = ""  # Reset for the next tool call
-                tool_call_name = None
-                tool_call_id = None
-            except json.JSONDecodeError:
-                # Incomplete JSON; continue accumulating
-                pass
-
-    return response.choices[0].message.content
+    metrics = TurnMetrics()
+
+    # Auch ein fehlgeschlagener oder abgebrochener Turn gibt die zwischengespeicherten Payloads frei und wird gezählt
+    failed = True
+    try:
+        # Verlauf auf das Token-Budget verdichten, bevor er erneut gesendet wird
+        if isinstance(chat_history, ChatHistory):
+            await chat_history.compact(summarise_history)
+
+        # Nur die für den Prompt relevanten Tools senden (plus die bereits im Gespräch genutzten)
+        tools = select_tools(prompt, chat_history, toolbox)
+
+        chat_history.append({"role": "user", "content": prompt})
+
+        # # for o1 models, there is no system prompt - replace it with user
+        # if model.startswith("o1"):
+        #     for item in chat_history:
+        #         if item["role"] == "system":
+        #             item["role"] = "user"
+
+        # Systemprompt, Tools und bisheriger Verlauf bilden einen stabilen Präfix, der vom Provider gecacht werden kann.
+        # Die Uhrzeit hängt deshalb nicht im Systemprompt, sondern als letzte Nachricht an jeder Anfrage.
+        time_message = get_time_message()
+
+        while True:
+            metrics.iterations += 1
+            # Bereits gesendete Nachrichten liegen als fertige dicts vor und werden wiederverwendet
+            messages = [*to_payload(chat_history), time_message]
+            llm_started = time.perf_counter()
+            if on_text is None:
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    tools=tools
+                )
+                message, usage = response.choices[0].message, response.usage
+            else:
+                message, usage = await stream_chat_completion(messages, tools, on_text)
+            metrics.llm_seconds += time.perf_counter() - llm_started
+            metrics.add_usage(usage)
+            if usage is not None:
+                details = usage.prompt_tokens_details
+                cached_tokens = (details.cached_tokens or 0) if details else 0
+                logging.info(f"Prompt tokens: {usage.prompt_tokens}, cached: {cached_tokens}")
+            chat_history.append(message)
+
+            # if no tool is needed, break and return response
+            if message.tool_calls is None:
+                break
+
+            # Alle Tool-Calls dieses Turns nebenläufig ausführen; gather liefert die Ergebnisse
+            # in der ursprünglichen Reihenfolge, damit die tool-Nachrichten gültig bleiben.
+            semaphore = asyncio.Semaphore(MAX_PARALLEL_TOOL_CALLS)
+            tools_started = time.perf_counter()
+            tool_messages = await asyncio.gather(
+                *[call_tool(tc, user_id, toolbox, semaphore) for tc in message.tool_calls]
+            )
+            metrics.tool_seconds += time.perf_counter() - tools_started
+            chat_history.extend(tool_messages)
+        failed = False
+    finally:
+        if isinstance(chat_history, ChatHistory):
+            chat_history.release_payload()
+        metrics.finish(failed)
+    return message.content
 
 
 async def transcribe_audio(audio_file_data):
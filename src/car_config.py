@@ -0,0 +1,6 @@
+import os
+
+
+# Abstand (Sekunden), in dem der Fahrzeugzustand im Hintergrund aktualisiert wird. Gilt für den
+# Scheduler-Job und für maxAge von WeConnect - eigenes Modul, damit der Scheduler weconnect nicht beim Start lädt
+CAR_REFRESH_SECONDS = int(os.getenv("CAR_REFRESH_SECONDS", "600"))
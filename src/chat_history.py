@@ -0,0 +1,304 @@
+import os, sys, zlib, logging
+
+
+# Token-Budget für den Chatverlauf eines Nutzers; wird es überschritten, wird der Verlauf verdichtet
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+# Anzahl der letzten Nutzer-Turns, die immer unverändert erhalten bleiben
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "3"))
+
+# Grobe Schätzung: ein Token entspricht etwa vier Zeichen, plus Overhead pro Nachricht
+CHARS_PER_TOKEN = 4
+TOKENS_PER_MESSAGE = 4
+
+# Tool-Ergebnisse ab dieser Größe (Bytes) werden komprimiert im Speicher gehalten
+HISTORY_COMPRESS_MIN_BYTES = int(os.getenv("HISTORY_COMPRESS_MIN_BYTES", "2048"))
+
+SUMMARY_PREFIX = "Zusammenfassung des bisherigen Gesprächs:\n"
+STALE_TOOL_CONTENT = "[Veraltetes Tool-Ergebnis entfernt]"
+
+
+def _field(message, name):
+    """Liest ein Feld aus einer Nachricht - egal ob dict oder ChatCompletionMessage."""
+    if isinstance(message, dict):
+        return message.get(name)
+    return getattr(message, name, None)
+
+
+class ToolCall:
+    """
+    Schlanker Tool-Call. function liefert den Tool-Call selbst, damit tc.function.name
+    wie beim Objekt der OpenAI-Bibliothek funktioniert.
+    """
+    __slots__ = ("id", "name", "arguments")
+
+    def __init__(self, id, name, arguments):
+        self.id = id
+        self.name = sys.intern(name)
+        # Wiederkehrende Argumente (z.B. "{}") teilen sich einen String
+        self.arguments = sys.intern(arguments or "")
+
+    @property
+    def function(self):
+        return self
+
+    def to_dict(self):
+        return {"id": self.id, "type": "function", "function": {"name": self.name, "arguments": self.arguments}}
+
+
+class ChatMessage:
+    """
+    Nachricht im Chatverlauf mit genau den Feldern, die die API braucht.
+    Tool-Ergebnisse werden interniert bzw. ab HISTORY_COMPRESS_MIN_BYTES komprimiert gehalten.
+    Die dict-Form für die Anfrage wird einmal erzeugt und in den weiteren Anfragen des Turns wiederverwendet.
+    """
+    __slots__ = ("role", "_content", "tool_calls", "tool_call_id", "name", "_payload")
+
+    def __init__(self, role, content=None, tool_calls=None, tool_call_id=None, name=None):
+        self.role = sys.intern(role)
+        self.tool_calls = tuple(tool_calls) if tool_calls else None
+        self.tool_call_id = tool_call_id
+        self.name = sys.intern(name) if name else None
+        self._content = self._pack(role, content)
+        self._payload = None
+
+    @staticmethod
+    def _pack(role, content):
+        if role != "tool" or not isinstance(content, str):
+            return content
+        if len(content) >= HISTORY_COMPRESS_MIN_BYTES:
+            return zlib.compress(content.encode(), 1)
+        # Gleiche Tool-Ergebnisse (z.B. aus dem Tool-Cache) teilen sich einen String
+        return sys.intern(content)
+
+    @property
+    def content(self):
+        if isinstance(self._content, bytes):
+            return zlib.decompress(self._content).decode()
+        return self._content
+
+    def __repr__(self):
+        return f"ChatMessage({self.to_dict()!r})"
+
+    @classmethod
+    def from_message(cls, message):
+        """Erzeugt eine ChatMessage aus einem dict oder einer ChatCompletionMessage."""
+        if isinstance(message, cls):
+            return message
+        tool_calls = [
+            ToolCall(_field(tc, "id"), _field(_field(tc, "function"), "name"), _field(_field(tc, "function"), "arguments"))
+            for tc in _field(message, "tool_calls") or []
+        ]
+        return cls(
+            _field(message, "role"), _field(message, "content"), tool_calls,
+            _field(message, "tool_call_id"), _field(message, "name")
+        )
+
+    def to_dict(self, cache=True):
+        """dict-Form für die API; mit cache=False (z.B. beim Speichern) wird sie nicht im Speicher gehalten."""
+        if self._payload is not None:
+            return self._payload
+        payload = {"role": self.role, "content": self.content}
+        if self.tool_calls:
+            payload["tool_calls"] = [tc.to_dict() for tc in self.tool_calls]
+        if self.tool_call_id is not None:
+            payload["tool_call_id"] = self.tool_call_id
+        if self.name is not None:
+            payload["name"] = self.name
+        # Komprimierte Inhalte nicht entpackt im Speicher halten
+        if cache and not isinstance(self._content, bytes):
+            self._payload = payload
+        return payload
+
+
+def to_payload(messages):
+    """Nachrichten in der Form, in der sie an die API gesendet werden."""
+    return [message.to_dict() if isinstance(message, ChatMessage) else message for message in messages]
+
+
+def count_tokens(message):
+    """Schätzt die Anzahl der Tokens, die eine Nachricht im Prompt belegt."""
+    chars = len(_field(message, "content") or "")
+    for tc in _field(message, "tool_calls") or []:
+        function = _field(tc, "function")
+        chars += len(_field(function, "name") or "") + len(_field(function, "arguments") or "")
+    return TOKENS_PER_MESSAGE + chars // CHARS_PER_TOKEN
+
+
+def is_summary(message):
+    return _field(message, "role") == "system" and (_field(message, "content") or "").startswith(SUMMARY_PREFIX)
+
+
+def render_for_summary(message):
+    """Einzeilige Textform einer Nachricht als Eingabe für die Zusammenfassung."""
+    role = _field(message, "role")
+    content = _field(message, "content") or ""
+    if is_summary(message):
+        return content
+    if role == "tool":
+        return f"tool ({_field(message, 'name')}): {content}"
+    tool_calls = _field(message, "tool_calls") or []
+    if tool_calls:
+        names = ", ".join(_field(_field(tc, "function"), "name") for tc in tool_calls)
+        content = (content + " " if content else "") + f"[ruft Tools auf: {names}]"
+    return f"{role}: {content}"
+
+
+def drop_unanswered_tool_calls(messages):
+    """
+    Entfernt Tool-Call-Nachrichten, auf die nicht alle Tool-Antworten folgen (z.B. ein beim Herunterfahren
+    abgebrochener Turn), samt deren Teilantworten. Die API lehnt solche Verläufe sonst bei jeder Anfrage ab.
+    """
+    result = []
+    i = 0
+    while i < len(messages):
+        message = messages[i]
+        tool_calls = _field(message, "tool_calls")
+        if not tool_calls:
+            # Tool-Antworten ohne vorangehenden Tool-Call sind ebenso ungültig
+            if _field(message, "role") != "tool":
+                result.append(message)
+            i += 1
+            continue
+        end = i + 1
+        while end < len(messages) and _field(messages[end], "role") == "tool":
+            end += 1
+        answered = {_field(reply, "tool_call_id") for reply in messages[i + 1:end]}
+        if {_field(tc, "id") for tc in tool_calls} <= answered:
+            result.extend(messages[i:end])
+        else:
+            logging.warning("Dropping tool calls without tool results from chat history")
+        i = end
+    return result
+
+
+class ChatHistory(list):
+    """
+    Chatverlauf als Liste von Nachrichten mit mitgeführter Token-Schätzung.
+    Eingefügte Nachrichten (dicts oder ChatCompletionMessages) werden in ChatMessages umgewandelt.
+
+    Die Token-Anzahl wird beim Anhängen einmalig pro Nachricht berechnet und aufsummiert,
+    sodass der Verlauf nicht bei jedem Turn neu gezählt werden muss. Mit compact() wird
+    der Verlauf auf das Budget verdichtet: Systemprompt und die letzten Turns bleiben erhalten,
+    ältere Tool-Ergebnisse werden entfernt und ältere Turns zu einer Zusammenfassung verdichtet.
+    """
+
+    def __init__(self, messages=(), token_budget=HISTORY_TOKEN_BUDGET, keep_turns=HISTORY_KEEP_TURNS):
+        super().__init__()
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.token_counts = []
+        self.total_tokens = 0
+        self.extend(messages)
+
+    def append(self, message):
+        message = ChatMessage.from_message(message)
+        super().append(message)
+        tokens = count_tokens(message)
+        self.token_counts.append(tokens)
+        self.total_tokens += tokens
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def insert(self, index, message):
+        message = ChatMessage.from_message(message)
+        super().insert(index, message)
+        tokens = count_tokens(message)
+        self.token_counts.insert(index, tokens)
+        self.total_tokens += tokens
+
+    def pop(self, index=-1):
+        message = super().pop(index)
+        self.total_tokens -= self.token_counts.pop(index)
+        return message
+
+    def clear(self):
+        super().clear()
+        self.token_counts = []
+        self.total_tokens = 0
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = [ChatMessage.from_message(message) for message in value]
+        else:
+            value = ChatMessage.from_message(value)
+        super().__setitem__(index, value)
+        self._recount()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._recount()
+
+    def _recount(self):
+        # Nur für seltene Slice-Operationen - der Normalfall zählt inkrementell
+        self.token_counts = [count_tokens(message) for message in self]
+        self.total_tokens = sum(self.token_counts)
+
+    def _replace(self, messages, token_counts):
+        list.__setitem__(self, slice(None), messages)
+        self.token_counts = token_counts
+        self.total_tokens = sum(token_counts)
+
+    def drop_unanswered_tool_calls(self):
+        """Repariert den Verlauf nach einem abgebrochenen Turn, siehe drop_unanswered_tool_calls()."""
+        messages = drop_unanswered_tool_calls(self)
+        if len(messages) != len(self):
+            list.__setitem__(self, slice(None), messages)
+            self._recount()
+
+    def release_payload(self):
+        """Gibt die zwischengespeicherten dicts nach dem Turn frei - zwischen den Turns bleibt der Verlauf schlank."""
+        for message in self:
+            message._payload = None
+
+    def _recent_start(self):
+        """Index der ersten Nachricht der letzten keep_turns Nutzer-Turns."""
+        user_indices = [i for i, message in enumerate(self) if _field(message, "role") == "user"]
+        if self.keep_turns <= 0 or not user_indices:
+            return len(self)
+        return user_indices[-min(self.keep_turns, len(user_indices))]
+
+    async def compact(self, summarise):
+        """
+        Verdichtet den Verlauf, falls das Token-Budget überschritten ist.
+        summarise ist eine Coroutine, die einen Text zu einer kurzen Zusammenfassung verdichtet.
+        """
+        if self.total_tokens <= self.token_budget:
+            return
+
+        head = 1 if len(self) > 0 and _field(self[0], "role") == "system" and not is_summary(self[0]) else 0
+        recent = max(self._recent_start(), head)
+        if recent <= head:
+            return
+
+        # Schritt 1: veraltete Tool-Ergebnisse außerhalb der letzten Turns entfernen
+        messages = list(self)
+        token_counts = list(self.token_counts)
+        for i in range(head, recent):
+            if _field(messages[i], "role") == "tool" and _field(messages[i], "content") != STALE_TOOL_CONTENT:
+                messages[i] = ChatMessage(
+                    "tool", STALE_TOOL_CONTENT, tool_call_id=_field(messages[i], "tool_call_id"), name=_field(messages[i], "name")
+                )
+                token_counts[i] = count_tokens(messages[i])
+        self._replace(messages, token_counts)
+        if self.total_tokens <= self.token_budget:
+            logging.info(f"Chat history compacted by dropping stale tool results: {self.total_tokens} tokens")
+            return
+
+        # Schritt 2: ältere Turns (inkl. einer früheren Zusammenfassung) zu einer Nachricht verdichten
+        if recent - head == 1 and is_summary(messages[head]):
+            return
+        older = "\n".join(render_for_summary(message) for message in messages[head:recent])
+        try:
+            summary = await summarise(older)
+        except Exception as e:
+            logging.error(f"Failed to summarise chat history: {e}")
+            return
+
+        summary_message = ChatMessage("system", SUMMARY_PREFIX + summary)
+        self._replace(
+            messages[:head] + [summary_message] + messages[recent:],
+            token_counts[:head] + [count_tokens(summary_message)] + token_counts[recent:]
+        )
+        logging.info(f"Chat history summarised: {self.total_tokens} tokens")
@@ -0,0 +1,130 @@
+import os, json, asyncio, logging
+import aiosqlite
+
+from src.chat_history import ChatMessage, drop_unanswered_tool_calls
+
+# Logging-Konfiguration für Debugging
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Geänderte Chatverläufe werden gesammelt und in diesem Abstand (Sekunden) gemeinsam geschrieben
+CONVERSATION_FLUSH_SECONDS = float(os.getenv("CONVERSATION_FLUSH_SECONDS", "10"))
+
+
+def serialise_message(message):
+    """Nachricht als JSON-fähiges dict - ChatCompletionMessages werden auf die für die API nötigen Felder reduziert."""
+    if isinstance(message, dict):
+        return message
+    if isinstance(message, ChatMessage):
+        # Nicht zwischenspeichern - sonst behielte jeder ruhende Verlauf nach dem Flush seine dicts
+        return message.to_dict(cache=False)
+    data = {"role": message.role, "content": message.content}
+    if message.tool_calls:
+        data["tool_calls"] = [tc.model_dump(exclude_none=True) for tc in message.tool_calls]
+    return data
+
+
+class ConversationStore:
+    """
+    Speichert die Chatverläufe der Nutzer in SQLite. Änderungen werden nur vorgemerkt
+    und gebündelt in einer Transaktion geschrieben (write-behind), damit ein Turn nicht auf die SD-Karte wartet.
+    """
+
+    def __init__(self, db_name='database/conversations.sqlite', flush_interval=CONVERSATION_FLUSH_SECONDS):
+        self.db_name = db_name
+        self.flush_interval = flush_interval
+        self.conn = None
+        self.pending = dict()  # user_id -> Chatverlauf, der noch geschrieben werden muss
+        self.in_flight = dict()  # user_id -> Chatverlauf, der gerade geschrieben wird
+        self.flush_task = None
+
+    async def connect(self):
+        try:
+            logger.info(f"Connecting to database: {self.db_name}")
+            self.conn = await aiosqlite.connect(self.db_name)
+            await self._create_table()
+            self.flush_task = asyncio.create_task(self._flush_loop())
+        except aiosqlite.Error as e:
+            logger.error(f"Failed to connect to database: {e}")
+            raise
+
+    async def _create_table(self):
+        try:
+            async with self.conn.execute('''CREATE TABLE IF NOT EXISTS conversations
+                                            (user_id INTEGER PRIMARY KEY, messages TEXT NOT NULL)''') as cursor:
+                await self.conn.commit()
+            logger.info("Conversation table ensured exists")
+        except aiosqlite.Error as e:
+            logger.error(f"Failed to create table: {e}")
+            raise
+
+    async def load(self, user_id):
+        """Liefert den gespeicherten Verlauf als Liste von dicts (leer, wenn es keinen gibt)."""
+        if self.conn is None:
+            return []
+        try:
+            async with self.conn.execute('SELECT messages FROM conversations WHERE user_id = ?', (user_id,)) as cursor:
+                row = await cursor.fetchone()
+            return drop_unanswered_tool_calls(json.loads(row[0])) if row else []
+        except (aiosqlite.Error, json.JSONDecodeError) as e:
+            logger.error(f"Failed to load conversation of user {user_id}: {e}")
+            return []
+
+    def mark_dirty(self, user_id, chat_history):
+        """Merkt einen geänderten Verlauf zum Schreiben vor; serialisiert wird erst beim Flush."""
+        self.pending[user_id] = chat_history
+
+    def unsaved(self, user_id):
+        """Noch nicht (fertig) geschriebener Verlauf des Nutzers - aktueller als die Datenbank - oder None."""
+        chat_history = self.pending.get(user_id)
+        return chat_history if chat_history is not None else self.in_flight.get(user_id)
+
+    async def flush(self):
+        if self.conn is None or not self.pending:
+            return
+        pending, self.pending = self.pending, dict()
+        # Bis zum Commit bleiben die Verläufe für Ladevorgänge sichtbar, sonst lädt ein gerade
+        # verdrängter Nutzer den älteren Stand aus der Datenbank
+        self.in_flight.update(pending)
+        rows = [
+            # Ein gerade laufender Turn wird ohne seine noch unbeantworteten Tool-Calls gespeichert
+            (user_id, json.dumps([serialise_message(message) for message in drop_unanswered_tool_calls(chat_history)], ensure_ascii=False))
+            for user_id, chat_history in pending.items()
+        ]
+        try:
+            await self.conn.executemany('INSERT OR REPLACE INTO conversations (user_id, messages) VALUES (?, ?)', rows)
+            await self.conn.commit()
+            logger.info(f"Stored conversations of {len(rows)} users")
+        except aiosqlite.Error as e:
+            logger.error(f"Failed to store conversations: {e}")
+            # Beim nächsten Flush erneut versuchen, neuere Änderungen haben Vorrang
+            for user_id, chat_history in pending.items():
+                self.pending.setdefault(user_id, chat_history)
+        finally:
+            for user_id, chat_history in pending.items():
+                if self.in_flight.get(user_id) is chat_history:
+                    del self.in_flight[user_id]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def shutdown(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+        try:
+            await self.flush()
+            if self.conn is not None:
+                await self.conn.close()
+            logger.info("Database connection closed")
+        except aiosqlite.Error as e:
+            logger.error(f"Failed to close database connection: {e}")
+
+conversation_store = ConversationStore()
@@ -0,0 +1,208 @@
+import os, time, asyncio, logging
+from functools import wraps
+
+
+# Lokaler Prometheus-Endpunkt; METRICS_PORT=0 deaktiviert ihn
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+# Bucket-Grenzen in Sekunden bzw. Tokens
+TIME_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10)
+
+
+class Histogram:
+    """Histogramm mit festen Buckets, optional aufgeteilt nach einem Label (z.B. Tool-Name)."""
+
+    def __init__(self, name, help_text, buckets, label=None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label = label
+        self.series = dict()  # label_value -> [bucket_counts, sum, count]
+
+    def observe(self, value, label_value=None):
+        series = self.series.setdefault(label_value, [[0] * len(self.buckets), 0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def quantile(self, q, label_value=None):
+        """Schätzt ein Quantil aus den Buckets (obere Bucket-Grenze)."""
+        series = self.series.get(label_value)
+        if not series or series[2] == 0:
+            return None
+        rank = q * series[2]
+        for bound, count in zip(self.buckets, series[0]):
+            if count >= rank:
+                return bound
+        return float("inf")
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_value, (bucket_counts, total, count) in sorted(self.series.items(), key=lambda item: str(item[0])):
+            labels = f'{self.label}="{label_value}",' if self.label else ""
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{labels}le="+Inf"}} {count}')
+            suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class Gauge:
+    """Momentanwert, optional aufgeteilt nach einem Label (z.B. Pool-Name)."""
+
+    def __init__(self, name, help_text, label=None):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.values = dict()  # label_value -> Wert
+
+    def set(self, value, label_value=None):
+        self.values[label_value] = value
+
+    def inc(self, label_value=None, amount=1):
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def dec(self, label_value=None, amount=1):
+        self.inc(label_value, -amount)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        for label_value, value in sorted(self.values.items(), key=lambda item: str(item[0])):
+            labels = f'{{{self.label}="{label_value}"}}' if self.label else ""
+            lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+TURN_SECONDS = Histogram("house_chat_turn_seconds", "Total time of a conversation turn", TIME_BUCKETS)
+LLM_SECONDS = Histogram("house_chat_llm_seconds", "Time spent waiting for completions per turn", TIME_BUCKETS)
+TOOL_TURN_SECONDS = Histogram("house_chat_turn_tool_seconds", "Time spent in tool calls per turn", TIME_BUCKETS)
+TOOL_SECONDS = Histogram("house_chat_tool_seconds", "Duration of a single tool invocation", TIME_BUCKETS, label="tool")
+HANDLER_SECONDS = Histogram("house_chat_handler_seconds", "Duration of a Telegram handler or user turn", TIME_BUCKETS, label="handler")
+LOOP_ITERATIONS = Histogram("house_chat_loop_iterations", "Completions per conversation turn", COUNT_BUCKETS)
+PROMPT_TOKENS = Histogram("house_chat_prompt_tokens", "Prompt tokens per turn", TOKEN_BUCKETS)
+COMPLETION_TOKENS = Histogram("house_chat_completion_tokens", "Completion tokens per turn", TOKEN_BUCKETS)
+CACHED_TOKENS = Histogram("house_chat_cached_tokens", "Cached prompt tokens per turn", TOKEN_BUCKETS)
+POOL_WAIT_SECONDS = Histogram("house_chat_pool_wait_seconds", "Time a blocking tool call waited for a pool worker", TIME_BUCKETS, label="pool")
+POOL_QUEUED = Gauge("house_chat_pool_queued", "Tool calls waiting for a pool worker", label="pool")
+POOL_RUNNING = Gauge("house_chat_pool_running", "Tool calls running on a pool worker", label="pool")
+TURNS_FAILED = Gauge("house_chat_turns_failed", "Conversation turns that ended with an error or were cancelled")
+
+HISTOGRAMS = [
+    TURN_SECONDS, LLM_SECONDS, TOOL_TURN_SECONDS, TOOL_SECONDS, HANDLER_SECONDS,
+    LOOP_ITERATIONS, PROMPT_TOKENS, COMPLETION_TOKENS, CACHED_TOKENS, POOL_WAIT_SECONDS,
+]
+GAUGES = [POOL_QUEUED, POOL_RUNNING, TURNS_FAILED]
+
+
+class TurnMetrics:
+    """Sammelt die Messwerte eines Turns von generate_chat_response und übernimmt sie am Ende in die Histogramme."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.llm_seconds = 0.0
+        self.tool_seconds = 0.0
+        self.iterations = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+
+    def add_usage(self, usage):
+        if usage is None:
+            return
+        self.prompt_tokens += usage.prompt_tokens or 0
+        self.completion_tokens += usage.completion_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.cached_tokens += (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+    def finish(self, failed=False):
+        total = time.perf_counter() - self.started
+        if failed:
+            TURNS_FAILED.inc()
+        TURN_SECONDS.observe(total)
+        LLM_SECONDS.observe(self.llm_seconds)
+        TOOL_TURN_SECONDS.observe(self.tool_seconds)
+        LOOP_ITERATIONS.observe(self.iterations)
+        PROMPT_TOKENS.observe(self.prompt_tokens)
+        COMPLETION_TOKENS.observe(self.completion_tokens)
+        CACHED_TOKENS.observe(self.cached_tokens)
+        logging.info(
+            f"Turn {'failed' if failed else 'finished'} after {total:.2f}s (llm {self.llm_seconds:.2f}s, tools {self.tool_seconds:.2f}s, "
+            f"{self.iterations} iterations, tokens prompt={self.prompt_tokens} cached={self.cached_tokens} "
+            f"completion={self.completion_tokens})"
+        )
+
+
+def track_handler(func):
+    """Misst die Dauer eines Telegram-Handlers."""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, func.__name__)
+    return wrapper
+
+
+def render_prometheus():
+    lines = []
+    for metric in HISTOGRAMS + GAUGES:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def render_summary():
+    """Kurze, lesbare Übersicht für den /stats-Befehl."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        for label_value, (_, total, count) in sorted(histogram.series.items(), key=lambda item: str(item[0])):
+            if count == 0:
+                continue
+            name = histogram.name.replace("house_chat_", "") + (f" [{label_value}]" if label_value else "")
+            lines.append(
+                f"{name}: n={count}, avg={total / count:.2f}, "
+                f"p50≤{histogram.quantile(0.5, label_value)}, p95≤{histogram.quantile(0.95, label_value)}"
+            )
+    for gauge in GAUGES:
+        for label_value, value in sorted(gauge.values.items(), key=lambda item: str(item[0])):
+            lines.append(gauge.name.replace("house_chat_", "") + (f" [{label_value}]" if label_value else "") + f": {value}")
+    return "\n".join(lines) if lines else "Noch keine Messwerte vorhanden."
+
+
+async def _handle_metrics_request(reader, writer):
+    try:
+        request_line = await reader.readline()
+        # Header überspringen
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        if request_line.split(b" ")[1:2] == [b"/metrics"]:
+            body = render_prometheus().encode()
+            status = b"200 OK"
+        else:
+            body = b"Not Found\n"
+            status = b"404 Not Found"
+        writer.write(
+            b"HTTP/1.1 " + status + b"\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logging.error(f"Failed to serve metrics: {e}")
+    finally:
+        writer.close()
+
+
+async def start_metrics_server():
+    """Startet den lokalen /metrics-Endpunkt im Prometheus-Textformat."""
+    if METRICS_PORT == 0:
+        return None
+    server = await asyncio.start_server(_handle_metrics_request, METRICS_HOST, METRICS_PORT)
+    logging.info(f"Metrics endpoint listening on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return server
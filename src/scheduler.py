@@ -1,174 +1,250 @@
-import os, logging, datetime, pytz
+import os, asyncio, logging, datetime, functools
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
-from telegram import Bot
 from telegramify_markdown import markdownify
 
-from src.telegram_user_data import USER_DATA, create_user_data
+from src.telegram_user_data import USER_DATA, get_user_data, save_user_data, user_lock
 from src.telegram_user_id_manager import user_id_manager
 from src.ai_responses import generate_chat_response
 from src.ai_prompts import get_schedule_sysprompt
+from src.todo_reminders import init_reminders, schedule_reminder
+from src.car_config import CAR_REFRESH_SECONDS
 
-import src.tools.trash_app as trash
+# DWD-Monitor und Todo-Erinnerungen laufen direkt nach dem Start; Müll und Auto werden erst im Job importiert,
+# damit deren Abhängigkeiten (ics, weconnect) nicht beim Start geladen werden
 import src.tools.dwd_app as dwd
 import src.tools.todo_app as todo
-import src.tools.news_app as news
 
 
-async def init_scheduler_job():
+# Jobs, deren Prompt pro Nutzer einzeln beantwortet werden soll (kommagetrennte Job-Namen, z.B. "news_job").
+# Alle anderen Jobs sind nutzerunabhängig: der Agent läuft einmal und die Antwort geht an alle Nutzer.
+PERSONALISED_JOBS = {job.strip() for job in os.getenv("SCHEDULE_PERSONALISED_JOBS", "").split(",") if job.strip()}
+# Außerhalb dieser Stunden werden nur Unwetterwarnungen (ab Stufe 3) sofort gemeldet, der Rest am Morgen
+DWD_ACTIVE_HOURS = tuple(int(hour) for hour in os.getenv("DWD_ACTIVE_HOURS", "6-22").split("-"))
+# Ohne Zugangsdaten für WeConnect wird der Fahrzeugzustand nicht abgefragt
+CAR_CONFIGURED = bool(os.getenv("VW_USER") and os.getenv("VW_PASS") and os.getenv("VW_VIN"))
+# Maximale Anzahl gleichzeitig laufender Sendungen bzw. personalisierter Agent-Läufe
+SCHEDULE_MAX_PARALLEL_SENDS = int(os.getenv("SCHEDULE_MAX_PARALLEL_SENDS", "8"))
+
+
+class ScheduledJob:
     """
-    We handle two issues here:
-    - We make sure that all users have a USER_DATA object, because it may be the case that the user has not yet sent a message to the bot since restart
-    - We create a schedule_user_data object that is only used in the context of the scheduler. This object is same as the USER_DATA object, but only contains the chat history and the user_id of the schedule run. Only the response of the scheduler is stored the global USER_DATA object.
+    Ein geplanter Push: wann (trigger), ob (precondition) und was (prompt) gesendet wird.
+    precondition ist eine optionale Coroutine; liefert sie None oder False, entfällt der Lauf,
+    sonst wird ihr Ergebnis an prompt übergeben, falls prompt eine Funktion ist.
     """
-    bot = Bot(os.getenv("TELEGRAM_BOT_TOKEN"))
-    global USER_DATA, user_id_manager
-    all_users = await user_id_manager.get_all_users()
-    for user_id in all_users:
-        if user_id in USER_DATA:
-            continue
-        await create_user_data(user_id)
-    
-    current_date = datetime.datetime.now(tz=pytz.timezone("Europe/Berlin")).strftime("%Y-%m-%d %H:%M")
-    schedule_user_data = dict()
-    for user_id in USER_DATA.keys():
-        schedule_user_data[user_id] = dict()
-        schedule_user_data[user_id]["user_id"] = user_id
-        schedule_user_data[user_id]["chat_history"] = [
-            {"role": "system", "content": get_schedule_sysprompt(current_date)}
-        ]
-    return bot, schedule_user_data
-
-
-# TODO: User-Data ist das falsche Objekt. Das ist nicht initialisiert. Besser wäre eine Funktion, die Jobs anlegt per Funktion und hier wird dann pro User der Job ausgeführt nach dem u.g. Schema - aber für einen ersten Wurf ist das nice!
-
-async def weather_job():
-    global USER_DATA
-    bot, schedule_user_data = await init_scheduler_job()
-    for user_id in schedule_user_data.keys():
-        ai_response = await generate_chat_response(f"Wie wird das Wetter heute?", schedule_user_data[user_id])
-        try:
-            await bot.send_message(chat_id=user_id, text=markdownify(ai_response), parse_mode="MarkdownV2")
-            USER_DATA[user_id]["chat_history"].append({"role": "assistant", "content": ai_response})
-        except Exception as e:
-            logging.error(f"Fehler beim Senden an {user_id}: {e}")
 
+    def __init__(self, name, trigger, prompt, precondition=None, personalised=None):
+        self.name = name
+        self.trigger = trigger
+        self.prompt = prompt
+        self.precondition = precondition
+        self.personalised = name in PERSONALISED_JOBS if personalised is None else personalised
 
-async def weather_forecast_job():
-    global USER_DATA
-    bot, schedule_user_data = await init_scheduler_job()
-    for user_id in USER_DATA.keys():
-        ai_response = await generate_chat_response(f"Wie wird das Wetter in den kommenden Tagen?", schedule_user_data[user_id])
-        try:
-            await bot.send_message(chat_id=user_id, text=markdownify(ai_response), parse_mode="MarkdownV2")
-            USER_DATA[user_id]["chat_history"].append({"role": "assistant", "content": ai_response})
-        except Exception as e:
-            logging.error(f"Fehler beim Senden an {user_id}: {e}")
+    async def build_prompt(self):
+        if self.precondition is None:
+            return self.prompt
+        context = await self.precondition()
+        if context is None or context is False:
+            return None
+        return self.prompt(context) if callable(self.prompt) else self.prompt
 
 
-async def energy_prices_job():
-    global USER_DATA
-    bot, schedule_user_data = await init_scheduler_job()
-    for user_id in USER_DATA.keys():
-        ai_response = await generate_chat_response(f"Wie entwickeln sich die Energiepreise bis morgen Abend, 24 Uhr? Wann ist der Strom besonders günstig?", schedule_user_data[user_id])
-        try:
-            await bot.send_message(chat_id=user_id, text=markdownify(ai_response), parse_mode="MarkdownV2")
-            USER_DATA[user_id]["chat_history"].append({"role": "assistant", "content": ai_response})
-        except Exception as e:
-            logging.error(f"Fehler beim Senden an {user_id}: {e}")
+def create_schedule_user_data(user_id):
+    """
+    Nutzerdaten, die nur im Kontext eines Scheduler-Laufs verwendet werden. Nur die Antwort
+    des Schedulers wird im globalen USER_DATA-Objekt gespeichert.
+    """
+    return {
+        "user_id": user_id,
+        "chat_history": [{"role": "system", "content": get_schedule_sysprompt()}]
+    }
 
 
-async def dwd_warning_job():
-    # report weather warnings
-    global USER_DATA
-    bot, schedule_user_data = await init_scheduler_job()
-    result, warn = dwd.check_new_warnings()
-    if result == False:
-        return
-    for user_id in USER_DATA.keys():
-        ai_response = await generate_chat_response(f"Folgende Wetterwarnungen liegen vor: {warn}. Bitte informiere den Nutzer über die jetzt wichtigsten Warnungen.", schedule_user_data[user_id])
-        try:
-            await bot.send_message(chat_id=user_id, text=markdownify(ai_response), parse_mode="MarkdownV2")
-            USER_DATA[user_id]["chat_history"].append({"role": "assistant", "content": ai_response})
-        except Exception as e:
-            logging.error(f"Fehler beim Senden an {user_id}: {e}")
+async def get_recipients():
+    """Registrierte Nutzer (aus dem Speicher des user_id_manager) und alle gerade aktiven Nutzer."""
+    global USER_DATA, user_id_manager
+    all_users = await user_id_manager.get_all_users()
+    return list(dict.fromkeys([*all_users, *USER_DATA.keys()]))
 
 
-async def tomorrow_trash_job():
-    # report energy prices
-    global USER_DATA
-    bot, schedule_user_data = await init_scheduler_job()
-    result = await trash.get_tomorrows_trash()
-    if len(result) == 0:
-        return
-    if result == "" or result == "[]":
-        return
-    for user_id in USER_DATA.keys():
-        ai_response = await generate_chat_response(f"Welcher Müll wird morgen abgeholt?", schedule_user_data[user_id])
+async def send_scheduled_response(bot, user_id, ai_response, semaphore):
+    async with semaphore:
         try:
             await bot.send_message(chat_id=user_id, text=markdownify(ai_response), parse_mode="MarkdownV2")
-            USER_DATA[user_id]["chat_history"].append({"role": "assistant", "content": ai_response})
         except Exception as e:
             logging.error(f"Fehler beim Senden an {user_id}: {e}")
-
-
-async def reminder_job():
-    # report open and due todos
-    global USER_DATA
-    bot, schedule_user_data = await init_scheduler_job()
-    
-    result = await todo.get_overdue_todos()
-    if result == "[]": # empty list, no overdue items
-        return
-
-    for user_id in USER_DATA.keys():
-        ai_response = await generate_chat_response(f"Welche Todos sind überfällig?", schedule_user_data[user_id])
+            return
+    # Erst nach einem laufenden Turn anhängen - außerhalb des Semaphors, damit andere Sendungen nicht warten
+    try:
+        async with user_lock(user_id):
+            user_data = await get_user_data(user_id)
+            user_data["chat_history"].append({"role": "assistant", "content": ai_response})
+            save_user_data(user_data)
+    except Exception as e:
+        logging.error(f"Fehler beim Speichern der Nachricht für {user_id}: {e}")
+
+
+async def generate_personalised_response(prompt, user_id, semaphore):
+    async with semaphore:
         try:
-            await bot.send_message(chat_id=user_id, text=markdownify(ai_response), parse_mode="MarkdownV2")
-            USER_DATA[user_id]["chat_history"].append({"role": "assistant", "content": ai_response})
+            return await generate_chat_response(prompt, create_schedule_user_data(user_id))
         except Exception as e:
-            logging.error(f"Fehler beim Senden an {user_id}: {e}")
+            logging.error(f"Fehler beim Erzeugen der Antwort für {user_id}: {e}")
+            return None
 
 
-async def news_job():
-    global USER_DATA
-    bot, schedule_user_data = await init_scheduler_job()
-    
-    for user_id in USER_DATA.keys():
-        ai_response = await generate_chat_response(f"Welche News gibt es aktuell für den Nutzer?", schedule_user_data[user_id])
-        try:
-            await bot.send_message(chat_id=user_id, text=markdownify(ai_response), parse_mode="MarkdownV2")
-            USER_DATA[user_id]["chat_history"].append({"role": "assistant", "content": ai_response})
-        except Exception as e:
-            logging.error(f"Fehler beim Senden an {user_id}: {e}")
-
+async def run_scheduled_prompt(bot, prompt, personalised=False):
+    """
+    Beantwortet einen geplanten Prompt und verschickt die Antwort an alle Nutzer.
+    Standardmäßig läuft der Agent nur einmal und die Antwort wird an alle Nutzer gleichzeitig verteilt;
+    mit personalised=True wird der Prompt für jeden Nutzer einzeln beantwortet.
+    """
+    user_ids = await get_recipients()
+    if not user_ids:
+        return
 
+    semaphore = asyncio.Semaphore(SCHEDULE_MAX_PARALLEL_SENDS)
+    if personalised:
+        responses = await asyncio.gather(*[generate_personalised_response(prompt, user_id, semaphore) for user_id in user_ids])
+    else:
+        # Die Tools sind nutzerunabhängig, daher reicht ein Agent-Lauf für alle
+        ai_response = await generate_chat_response(prompt, create_schedule_user_data(None))
+        responses = [ai_response] * len(user_ids)
+    logging.info(f"Scheduled prompt answered {'per user' if personalised else 'once'} for {len(user_ids)} users")
+
+    # Jeder Nutzer wird einzeln behandelt - ein Fehler bei einem Nutzer hält die anderen nicht auf
+    await asyncio.gather(*[
+        send_scheduled_response(bot, user_id, ai_response, semaphore)
+        for user_id, ai_response in zip(user_ids, responses)
+        if ai_response
+    ])
+
+
+async def run_job(job, bot):
+    try:
+        prompt = await job.build_prompt()
+        if prompt is None:
+            logging.info(f"Scheduled job {job.name} skipped")
+            return
+        await run_scheduled_prompt(bot, prompt, job.personalised)
+    except Exception as e:
+        logging.error(f"Scheduled job {job.name} failed: {e}", exc_info=True)
+
+
+async def trash_tomorrow():
+    import src.tools.trash_app as trash
+    result = await trash.get_tomorrows_trash()
+    if len(result) == 0 or result == "" or result == "[]":
+        return None
+    return result
 
-def my_scheduler():
-    scheduler = AsyncIOScheduler()
 
-    morning_cron = CronTrigger(hour=7, minute=0)
-    scheduler.add_job(weather_job, morning_cron, misfire_grace_time=60)
+SCHEDULED_JOBS = [
+    ScheduledJob("weather_job", CronTrigger(hour=7, minute=0), "Wie wird das Wetter heute?"),
+    ScheduledJob("weather_forecast_job", CronTrigger(hour=12, minute=0), "Wie wird das Wetter in den kommenden Tagen?"),
+    ScheduledJob(
+        "energy_prices_job", CronTrigger(hour=14, minute=0),
+        "Wie entwickeln sich die Energiepreise bis morgen Abend, 24 Uhr? Wann ist der Strom besonders günstig?"
+    ),
+    ScheduledJob("tomorrow_trash_job", CronTrigger(hour=19, minute=0), "Welcher Müll wird morgen abgeholt?", precondition=trash_tomorrow),
+    ScheduledJob("news_job", CronTrigger(hour="6,18", minute=0), "Welche News gibt es aktuell für den Nutzer?"),
+]
 
-    noon_cron = CronTrigger(hour=12, minute=0)
-    scheduler.add_job(weather_forecast_job, noon_cron, misfire_grace_time=60)
 
-    lunch_cron = CronTrigger(hour=14, minute=0)
-    scheduler.add_job(energy_prices_job, lunch_cron, misfire_grace_time=60)
+async def dwd_monitor_job(bot, scheduler):
+    """
+    Prüft die DWD-Warnungen auf neue, geänderte und aufgehobene Warnungen und meldet sie.
+    Das Intervall des Jobs richtet sich nach der aktuellen Warnstufe.
+    """
+    try:
+        diff, snapshot = await dwd.check_warning_changes()
+        if diff is not None:
+            hour = datetime.datetime.now().hour
+            active = DWD_ACTIVE_HOURS[0] <= hour < DWD_ACTIVE_HOURS[1]
+            severe = any(warning["level"] >= 3 for warning in diff["added"] + diff["changed"])
+            if active or severe:
+                # Als gemeldet übernehmen, bevor der Agent läuft - sonst käme dieselbe Änderung beim nächsten Lauf erneut
+                dwd.acknowledge_warnings(snapshot)
+                await run_scheduled_prompt(
+                    bot,
+                    f"Die Wetterwarnungen haben sich geändert: {dwd.describe_warning_changes(diff)}. "
+                    f"Bitte informiere den Nutzer kurz über die jetzt wichtigsten Änderungen.",
+                    "dwd_warning_job" in PERSONALISED_JOBS
+                )
+    except Exception as e:
+        logging.error(f"DWD monitor failed: {e}", exc_info=True)
+
+    interval = dwd.poll_interval()
+    job = scheduler.get_job("dwd_monitor")
+    if job is not None and job.trigger.interval.total_seconds() != interval:
+        logging.info(f"DWD polling interval set to {interval}s")
+        scheduler.reschedule_job("dwd_monitor", trigger=IntervalTrigger(seconds=interval))
+
+
+def _refresh_car():
+    # Import im Worker-Thread, weconnect ist für den Event-Loop zu schwer
+    import src.tools.car_app as car
+    car.carApp.refresh()
+
+
+async def car_refresh_job():
+    """Aktualisiert den Fahrzeug-Snapshot, aus dem die Auto-Tools sofort antworten."""
+    try:
+        await asyncio.to_thread(_refresh_car)
+    except Exception as e:
+        logging.error(f"Car refresh failed: {e}")
+
+
+async def send_todo_reminder(bot, todo_id):
+    """Erinnert alle Nutzer genau einmal an ein fälliges Todo - ohne LLM-Aufruf."""
+    try:
+        item = await todo.todo_manager.get_todo(todo_id)
+        # Der Marker wird vor dem Senden gesetzt, damit eine Erinnerung auch nach einem Neustart nicht doppelt kommt
+        if item is None or not await todo.todo_manager.mark_notified(todo_id):
+            return
+        text = f"Erinnerung: {item.title} (fällig {item.due_date:%d.%m.%Y %H:%M}, Liste {item.category})"
+        user_ids = await get_recipients()
+        semaphore = asyncio.Semaphore(SCHEDULE_MAX_PARALLEL_SENDS)
+        await asyncio.gather(*[send_scheduled_response(bot, user_id, text, semaphore) for user_id in user_ids])
+        logging.info(f"Reminder for todo {todo_id} sent to {len(user_ids)} users")
+    except Exception as e:
+        logging.error(f"Reminder for todo {todo_id} failed: {e}", exc_info=True)
+
+
+async def rebuild_todo_reminders():
+    """Plant beim Start die Erinnerungen aller offenen, noch nicht gemeldeten Todos aus der Datenbank."""
+    pending = await todo.todo_manager.get_pending_reminders()
+    for item in pending:
+        schedule_reminder(item)
+    logging.info(f"Scheduled {len(pending)} todo reminders")
+
+
+def my_scheduler(bot):
+    """Plant alle Jobs aus SCHEDULED_JOBS; bot ist der langlebige Bot der Application."""
+    scheduler = AsyncIOScheduler()
 
-    hourly_cron = CronTrigger(hour="6-22", minute=0)
-    scheduler.add_job(dwd_warning_job, hourly_cron, misfire_grace_time=60)
+    for job in SCHEDULED_JOBS:
+        scheduler.add_job(run_job, job.trigger, args=[job, bot], id=job.name, misfire_grace_time=60)
 
-    trash_cron = CronTrigger(hour=19, minute=0)
-    scheduler.add_job(tomorrow_trash_job, trash_cron, misfire_grace_time=60)
+    # DWD-Warnungen mit adaptivem Intervall, erste Abfrage direkt nach dem Start
+    scheduler.add_job(
+        dwd_monitor_job, IntervalTrigger(seconds=dwd.DWD_POLL_SECONDS), args=[bot, scheduler], id="dwd_monitor",
+        next_run_time=datetime.datetime.now(), misfire_grace_time=60
+    )
 
-    reminder_cron = CronTrigger(minute="1-59/5")
-    scheduler.add_job(reminder_job, reminder_cron, misfire_grace_time=60)
+    # Fahrzeugzustand im Hintergrund aktualisieren, der Login erfolgt beim ersten Lauf
+    if CAR_CONFIGURED:
+        scheduler.add_job(
+            car_refresh_job, IntervalTrigger(seconds=CAR_REFRESH_SECONDS), id="car_refresh",
+            next_run_time=datetime.datetime.now(), misfire_grace_time=60, max_instances=1
+        )
 
-    news_cron = CronTrigger(hour="6,18", minute=0)
-    scheduler.add_job(news_job, news_cron, misfire_grace_time=60)
+    # Todo-Erinnerungen laufen als einmalige Jobs zum Fälligkeitszeitpunkt
+    init_reminders(scheduler, functools.partial(send_todo_reminder, bot))
 
 #     async def test_job():
 #         logging.info("Test-Job fired!")
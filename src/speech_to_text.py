@@ -0,0 +1,75 @@
+import os, io, time, asyncio, logging, threading
+
+from src.ai_responses import transcribe_audio
+
+
+# Transkriptions-Backend: "remote" (OpenAI whisper-1), "local" (Whisper auf der CPU) oder
+# "auto" (kurze Sprachnachrichten lokal, lange über die API)
+STT_MODE = os.getenv("STT_MODE", "remote")
+# Lokales Modell (faster-whisper), z.B. "tiny", "base", "small"; int8 ist das quantisierte CPU-Format
+STT_LOCAL_MODEL = os.getenv("STT_LOCAL_MODEL", "base")
+STT_LOCAL_COMPUTE_TYPE = os.getenv("STT_LOCAL_COMPUTE_TYPE", "int8")
+STT_LOCAL_THREADS = int(os.getenv("STT_LOCAL_THREADS", "0"))  # 0 = automatisch
+STT_LOCAL_BEAM_SIZE = int(os.getenv("STT_LOCAL_BEAM_SIZE", "1"))
+# Im auto-Modus werden nur Nachrichten bis zu dieser Länge (Sekunden) lokal transkribiert
+STT_LOCAL_MAX_SECONDS = float(os.getenv("STT_LOCAL_MAX_SECONDS", "20"))
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_local_model():
+    """Lädt das lokale Whisper-Modell beim ersten Gebrauch (im Worker-Thread, nicht beim Import)."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            from faster_whisper import WhisperModel
+
+            started = time.perf_counter()
+            _model = WhisperModel(
+                STT_LOCAL_MODEL, device="cpu", compute_type=STT_LOCAL_COMPUTE_TYPE, cpu_threads=STT_LOCAL_THREADS
+            )
+            logging.info(f"Loaded local whisper model {STT_LOCAL_MODEL} in {time.perf_counter() - started:.1f}s")
+    return _model
+
+
+def _transcribe_local_sync(audio_file_data):
+    model = get_local_model()
+    segments, _ = model.transcribe(io.BytesIO(bytes(audio_file_data)), language="de", beam_size=STT_LOCAL_BEAM_SIZE)
+    # segments ist ein Generator - die eigentliche Erkennung läuft erst beim Durchlaufen
+    return " ".join(segment.text.strip() for segment in segments).strip()
+
+
+async def transcribe_local(audio_file_data):
+    """Transkribiert eine Audiodatei lokal auf der CPU in einem Worker-Thread."""
+    return await asyncio.to_thread(_transcribe_local_sync, audio_file_data)
+
+
+async def transcribe_remote(audio_file_data):
+    """Transkribiert eine Audiodatei mit OpenAI whisper-1."""
+    return await transcribe_audio(audio_file_data)
+
+
+def use_local_backend(duration, mode=STT_MODE):
+    if mode == "local":
+        return True
+    if mode == "auto":
+        return duration is not None and duration <= STT_LOCAL_MAX_SECONDS
+    return False
+
+
+async def transcribe(audio_file_data, duration=None, mode=STT_MODE):
+    """
+    Transkribiert eine Sprachnachricht mit dem konfigurierten Backend.
+    duration ist die Länge in Sekunden (von Telegram mitgeliefert) und entscheidet im auto-Modus über das Backend.
+    Schlägt das lokale Backend fehl (z.B. faster-whisper nicht installiert), wird die API verwendet.
+    """
+    if use_local_backend(duration, mode):
+        started = time.perf_counter()
+        try:
+            text = await transcribe_local(audio_file_data)
+            logging.info(f"Local transcription of {duration}s audio took {time.perf_counter() - started:.2f}s")
+            return text
+        except Exception as e:
+            logging.error(f"Local transcription failed, falling back to remote API: {e}")
+    return await transcribe_remote(audio_file_data)
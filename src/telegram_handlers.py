@@ -2,16 +2,70 @@
 from telegram import Update
 from telegram.ext import CallbackContext
 from telegramify_markdown import markdownify
-from src.telegram_user_data import USER_DATA, create_user_data, reset_history
+from src.telegram_user_data import USER_DATA, create_user_data, reset_history, get_user_data, save_user_data, user_lock
+from src.conversation_store import conversation_store
 from src.telegram_user_id_manager import user_id_manager
 
-from src.ai_responses import generate_chat_response, transcribe_audio
-from src.scheduler import my_scheduler
-
-import os, logging
+from src.ai_responses import generate_chat_response
+from src.speech_to_text import transcribe
+from src.telegram_streaming import StreamingReply
+from src.telegram_mailbox import get_mailbox, close_mailboxes
+from src.scheduler import my_scheduler, rebuild_todo_reminders
+from src.metrics import track_handler, render_summary, start_metrics_server
+from src.toolbox.toolbox import get_cache_stats
+from src.toolbox.tool_pools import shutdown_pools
+from src.tools.todo_app import todo_manager
+
+import os, asyncio, logging
 from functools import wraps
 
 
+# Antworten schrittweise anzeigen, während das Modell noch schreibt
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "True") == "True"
+
+metrics_server = None
+
+
+async def reply_with_chat_response(update: Update, prompt, user_data):
+    """Generiert die Antwort und sendet sie - im Streaming-Modus als fortlaufend editierte Nachricht."""
+    if not STREAM_RESPONSES:
+        ai_response = await generate_chat_response(prompt, user_data)
+        return await update.message.reply_text(markdownify(ai_response), parse_mode="MarkdownV2")
+
+    reply = StreamingReply(update.message)
+    ai_response = await generate_chat_response(prompt, user_data, on_text=reply.update)
+    return await reply.finish(ai_response)
+
+
+@track_handler
+async def process_turn(update: Update, prompt):
+    """
+    Ein Turn des Nutzers - wird vom Mailbox-Worker strikt nacheinander pro Nutzer aufgerufen.
+    Gemessen wird hier statt in den Handlern, die die Nachricht nur noch einreihen.
+    """
+    async with user_lock(update.message.chat_id):
+        user_data = await get_user_data(update.message.chat_id)
+        try:
+            return await reply_with_chat_response(update, prompt, user_data)
+        finally:
+            # Ein abgebrochener Turn (z.B. beim Herunterfahren) darf keine Tool-Calls ohne Ergebnisse hinterlassen
+            user_data["chat_history"].drop_unanswered_tool_calls()
+            save_user_data(user_data)
+
+
+async def enqueue_turn(update: Update, prompt):
+    """Stellt die Nachricht in die Mailbox des Nutzers; bei voller Warteschlange wird sie abgelehnt."""
+    mailbox = get_mailbox(update.message.chat_id, process_turn)
+    if mailbox.put(update, prompt):
+        return
+    if isinstance(prompt, asyncio.Future):
+        prompt.cancel()
+    await update.message.reply_text(
+        markdownify("Dobbi kommt nicht hinterher - bitte warte kurz, bis die vorherigen Nachrichten beantwortet sind."),
+        parse_mode="MarkdownV2"
+    )
+
+
 # Annotation zur Überprüfung der Benutzerberechtigung
 def require_allowed_user(func):
     @wraps(func)
@@ -27,39 +81,27 @@ def require_allowed_user(func):
 @require_allowed_user
 async def handle_audio(update: Update, context: CallbackContext):
     """Verarbeitet empfangene Audionachrichten von Telegram."""
-    global USER_DATA
-
-    # Herunterladen der Audiodatei als Bytearray
-    user_id = update.message.chat_id
 
-    if not user_id in USER_DATA:
-        await create_user_data(user_id)
-    audio_file = await update.message.voice.get_file()
-    audio_file_data = await audio_file.download_as_bytearray()
+    async def download_and_transcribe(voice):
+        # Herunterladen der Audiodatei als Bytearray
+        audio_file = await voice.get_file()
+        audio_file_data = await audio_file.download_as_bytearray()
+        # Transkription auf Deutsch (lokal oder per API, je nach STT_MODE)
+        return await transcribe(audio_file_data, voice.duration)
 
-    # Transkription auf Deutsch und Senden des transkribierten Textes an den Nutzer
-    text = await transcribe_audio(audio_file_data)
+    # Die Transkription startet sofort, der Turn wird aber erst in der Reihenfolge des Eingangs ausgeführt
+    text = asyncio.create_task(download_and_transcribe(update.message.voice))
     # await update.message.reply_text(markdownify(f"Transkribierter Text: {text}"), parse_mode="MarkdownV2")
 
-    ai_response = await generate_chat_response(text, USER_DATA[user_id])
-    return await update.message.reply_text(markdownify(ai_response), parse_mode="MarkdownV2")
+    await enqueue_turn(update, text)
 
 
 @require_allowed_user
 async def handle_text(update: Update, context: CallbackContext):
     """Verarbeitet empfangene Textnachrichten von Telegram."""
-    global USER_DATA
-
-    # Textnachricht des Benutzers
+    # Textnachricht des Benutzers - die Antwort von OpenAI wird in der Mailbox des Nutzers generiert
     user_message = update.message.text
-    user_id = update.message.chat_id
-
-    if not user_id in USER_DATA:
-        await create_user_data(user_id)
-
-    # Antwort von OpenAI generieren
-    ai_response = await generate_chat_response(user_message, USER_DATA[user_id])
-    await update.message.reply_text(markdownify(ai_response), parse_mode="MarkdownV2")
+    await enqueue_turn(update, user_message)
 
 
 @require_allowed_user
@@ -84,6 +126,19 @@ async def reset(update: Update, context: CallbackContext):
     await update.message.reply_text(markdownify('...Obliviate... - Dobbi hat alles vergessen.'), parse_mode="MarkdownV2")
 
 
+@require_allowed_user
+async def stats(update: Update, context: CallbackContext):
+    """Zeigt Latenz-, Token- und Cache-Statistiken seit dem Start."""
+    cache_lines = [
+        f"{name}: {values['hits']} Treffer, {values['misses']} Abrufe, {values['shared']} geteilt"
+        for name, values in get_cache_stats().items()
+    ]
+    text = "Statistiken seit dem Start:\n\n" + render_summary()
+    if cache_lines:
+        text += "\n\nTool-Cache:\n" + "\n".join(cache_lines)
+    await update.message.reply_text(markdownify(text), parse_mode="MarkdownV2")
+
+
 async def error_handler(update: Update, context: CallbackContext):
     """Loggt Fehler und informiert den Benutzer."""
     logging.error(msg="Exception während eines Updates:", exc_info=context.error)
@@ -91,13 +146,27 @@ async def error_handler(update: Update, context: CallbackContext):
     await update.message.reply_text(markdownify('Dobbi ist ein misslicher Fehler unterlaufen. Tut mir leid...'), parse_mode="MarkdownV2")
 
 
-async def post_init(_application):
+async def post_init(application):
     """Initialisierung des Bots."""
+    global metrics_server
     await user_id_manager.connect()
-    scheduler = my_scheduler()
+    await conversation_store.connect()
+    # Todo-Datenbank einmal verbinden und das Schema anlegen, alle Tools teilen sich die Verbindung
+    await todo_manager.connect()
+    # Der Scheduler nutzt den Bot der Application samt dessen Verbindungspool
+    scheduler = my_scheduler(application.bot)
     scheduler.start()
+    await rebuild_todo_reminders()
+    metrics_server = await start_metrics_server()
 
 
 async def post_shutdown(_application):
     """Herunterfahren des Bots."""
+    await close_mailboxes()
+    shutdown_pools()
+    await conversation_store.shutdown()
+    await todo_manager.close()
     await user_id_manager.shutdown()
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
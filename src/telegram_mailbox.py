@@ -0,0 +1,108 @@
+import os, time, asyncio, logging
+from telegramify_markdown import markdownify
+
+
+# Nachrichten, die innerhalb dieses Zeitfensters (Sekunden) nacheinander eintreffen, werden zu einem Turn zusammengefasst
+MAILBOX_DEBOUNCE_SECONDS = float(os.getenv("MAILBOX_DEBOUNCE_SECONDS", "1.0"))
+# Maximale Anzahl wartender Nachrichten pro Nutzer
+MAILBOX_MAX_DEPTH = int(os.getenv("MAILBOX_MAX_DEPTH", "5"))
+
+
+class UserMailbox:
+    """
+    Warteschlange eines Nutzers. Ein Worker arbeitet die Nachrichten strikt nacheinander ab,
+    damit sich keine zwei Agent-Loops denselben Chatverlauf teilen. Mehrere schnell
+    hintereinander gesendete Nachrichten werden zu einem Prompt zusammengefasst.
+    """
+
+    def __init__(self, user_id, process, debounce=MAILBOX_DEBOUNCE_SECONDS, max_depth=MAILBOX_MAX_DEPTH):
+        self.user_id = user_id
+        self.process = process  # async process(update, prompt)
+        self.debounce = debounce
+        self.queue = asyncio.Queue(maxsize=max_depth)
+        self.worker = None
+
+    def put(self, update, prompt):
+        """
+        Stellt eine Nachricht ein. prompt ist ein Text oder ein Task, der den Text liefert (z.B. eine laufende Transkription).
+        Liefert False, wenn die Warteschlange voll ist.
+        """
+        try:
+            self.queue.put_nowait((update, prompt))
+        except asyncio.QueueFull:
+            return False
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+        return True
+
+    async def join(self):
+        """Wartet, bis alle eingestellten Nachrichten beantwortet sind."""
+        await self.queue.join()
+
+    async def _collect(self):
+        """Holt die nächste Nachricht und alle, die bis zum Ablauf des Zeitfensters nachkommen."""
+        items = [await self.queue.get()]
+        deadline = time.monotonic() + self.debounce
+        while True:
+            # Während des vorherigen Turns aufgelaufene Nachrichten ohne Wartezeit übernehmen
+            if not self.queue.empty():
+                items.append(self.queue.get_nowait())
+                deadline = time.monotonic() + self.debounce
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return items
+            try:
+                items.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+                deadline = time.monotonic() + self.debounce
+            except asyncio.TimeoutError:
+                return items
+
+    async def _run(self):
+        while not self.queue.empty():
+            items = await self._collect()
+            try:
+                prompts = []
+                for _, prompt in items:
+                    text = await prompt if isinstance(prompt, asyncio.Future) else prompt
+                    if text:
+                        prompts.append(text)
+                if prompts:
+                    if len(items) > 1:
+                        logging.info(f"Coalesced {len(items)} messages of user {self.user_id} into one turn")
+                    # Antwort auf die letzte Nachricht des Turns
+                    await self.process(items[-1][0], "\n".join(prompts))
+            except Exception as e:
+                logging.error(f"Failed to process messages of user {self.user_id}: {e}", exc_info=True)
+                await self._report_error(items[-1][0])
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+    async def _report_error(self, update):
+        try:
+            await update.message.reply_text(markdownify("Dobbi ist ein misslicher Fehler unterlaufen. Tut mir leid..."), parse_mode="MarkdownV2")
+        except Exception as e:
+            logging.error(f"Failed to report error to user {self.user_id}: {e}")
+
+    async def close(self):
+        if self.worker is not None and not self.worker.done():
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+
+
+MAILBOXES = dict()
+
+
+def get_mailbox(user_id, process):
+    if user_id not in MAILBOXES:
+        MAILBOXES[user_id] = UserMailbox(user_id, process)
+    return MAILBOXES[user_id]
+
+
+async def close_mailboxes():
+    for mailbox in MAILBOXES.values():
+        await mailbox.close()
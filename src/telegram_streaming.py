@@ -0,0 +1,60 @@
+import os, time, logging
+from telegram.error import BadRequest, RetryAfter
+from telegramify_markdown import markdownify
+
+
+# Mindestabstand zwischen zwei Edits derselben Nachricht - Telegram drosselt häufige Edits
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+
+# Telegram erlaubt maximal 4096 Zeichen pro Nachricht
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+
+
+class StreamingReply:
+    """
+    Antwortet auf eine Telegram-Nachricht, während der Text noch entsteht:
+    Die erste Textzeile wird sofort gesendet, danach wird dieselbe Nachricht gedrosselt editiert.
+    Zwischenstände gehen als reiner Text raus, nur die finale Nachricht wird mit markdownify formatiert.
+    """
+
+    def __init__(self, message, min_interval=STREAM_EDIT_INTERVAL):
+        self.message = message
+        self.min_interval = min_interval
+        self.reply = None
+        self.shown_text = ""
+        self.next_edit = 0.0
+
+    async def update(self, text):
+        """Callback für generate_chat_response: zeigt den bisherigen Text, sofern die Drossel es zulässt."""
+        if time.monotonic() < self.next_edit:
+            return
+        await self._show(text[:TELEGRAM_MAX_MESSAGE_LENGTH - 2] + " …")
+
+    async def finish(self, text):
+        """Ersetzt den Zwischenstand durch die finale, formatierte Antwort."""
+        formatted = markdownify(text)
+        if self.reply is None:
+            return await self.message.reply_text(formatted, parse_mode="MarkdownV2")
+        try:
+            return await self.reply.edit_text(formatted, parse_mode="MarkdownV2")
+        except RetryAfter as e:
+            # Beim letzten Edit lohnt kein Warten - die Antwort als neue Nachricht senden
+            logging.warning(f"Edit throttled by Telegram ({e.retry_after}s), sending final answer as new message")
+            return await self.message.reply_text(formatted, parse_mode="MarkdownV2")
+
+    async def _show(self, text):
+        if text == self.shown_text:
+            return
+        self.next_edit = time.monotonic() + self.min_interval
+        try:
+            if self.reply is None:
+                self.reply = await self.message.reply_text(text)
+            else:
+                await self.reply.edit_text(text)
+            self.shown_text = text
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            self.next_edit = time.monotonic() + retry_after
+        except BadRequest as e:
+            # z.B. "Message is not modified" - Zwischenstände sind nicht kritisch
+            logging.debug(f"Skipped streaming edit: {e}")
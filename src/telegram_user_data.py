@@ -1,8 +1,81 @@
-import datetime
+import os, asyncio, logging, weakref
+from collections import OrderedDict
+
 from src.ai_prompts import get_sysprompt
+from src.chat_history import ChatHistory, is_summary
+from src.conversation_store import conversation_store
+
+
+# Anzahl der Nutzer, deren Daten im Speicher bleiben; die übrigen werden bei Bedarf aus der Datenbank geladen
+USER_DATA_MAX_USERS = int(os.getenv("USER_DATA_MAX_USERS", "8"))
+
+# Zuletzt aktive Nutzer zuletzt (LRU)
+USER_DATA = OrderedDict()
+_loading = dict()  # user_id -> Task, der den Verlauf gerade lädt
+# Pro Nutzer ein Lock um jede Änderung des Verlaufs: ein Turn hält es vollständig, damit z.B. eine
+# Scheduler-Nachricht nicht zwischen Tool-Calls und deren Ergebnissen landet. Schwache Referenzen:
+# ein Lock lebt nur, solange es gehalten oder erwartet wird, der Speicher bleibt wie bei USER_DATA begrenzt
+_locks = weakref.WeakValueDictionary()
+
+
+def user_lock(user_id):
+    lock = _locks.get(user_id)
+    if lock is None:
+        lock = _locks[user_id] = asyncio.Lock()
+    return lock
+
+
+def _remember(user_id, user_data):
+    USER_DATA[user_id] = user_data
+    USER_DATA.move_to_end(user_id)
+    while len(USER_DATA) > USER_DATA_MAX_USERS:
+        evicted_id, _ = USER_DATA.popitem(last=False)
+        logging.info(f"Evicted user data of {evicted_id} from memory")
+
 
+def _new_history():
+    return ChatHistory([
+            {"role": "system", "content": get_sysprompt()}
+        ])
 
-USER_DATA = {}
+
+async def _load_user_data(user_id):
+    # Noch nicht geschriebene Änderungen sind aktueller als die Datenbank
+    chat_history = conversation_store.unsaved(user_id)
+    if chat_history is None:
+        messages = await conversation_store.load(user_id)
+        if messages:
+            # Systemprompt immer in der aktuellen Fassung verwenden
+            if messages[0].get("role") == "system" and not is_summary(messages[0]):
+                messages[0] = {"role": "system", "content": get_sysprompt()}
+            chat_history = ChatHistory(messages)
+        else:
+            chat_history = _new_history()
+    user_data = {"user_id": user_id, "chat_history": chat_history}
+    _remember(user_id, user_data)
+    return user_data
+
+
+async def get_user_data(user_id):
+    """
+    Liefert das Nutzerdatenobjekt. Beim ersten Zugriff wird der Verlauf aus der Datenbank geladen.
+    """
+    if user_id in USER_DATA:
+        USER_DATA.move_to_end(user_id)
+        return USER_DATA[user_id]
+    # Gleichzeitige Zugriffe (z.B. Scheduler und Nachricht) teilen sich einen Ladevorgang
+    if user_id not in _loading:
+        _loading[user_id] = asyncio.create_task(_load_user_data(user_id))
+    try:
+        return await asyncio.shield(_loading[user_id])
+    finally:
+        if _loading.get(user_id) is not None and _loading[user_id].done():
+            del _loading[user_id]
+
+
+def save_user_data(user_data):
+    """Merkt den Chatverlauf zum Speichern vor - geschrieben wird gebündelt im Hintergrund."""
+    conversation_store.mark_dirty(user_data["user_id"], user_data["chat_history"])
 
 
 async def reset_history(user_id):
@@ -10,23 +83,14 @@ async def reset_history(user_id):
     Setze _nur_ die chat_history des Nutzers zurück
     """
     global USER_DATA
-    if not user_id in USER_DATA:
-        USER_DATA[user_id] = dict()
-        USER_DATA[user_id]["user_id"] = user_id
-    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-    current_time = datetime.datetime.now().strftime("%H:%M")
-    USER_DATA[user_id]["chat_history"] = [
-            {"role": "system", "content": get_sysprompt(current_date, current_time)}
-        ]
+    user_data = USER_DATA.get(user_id, {"user_id": user_id})
+    user_data["chat_history"] = _new_history()
+    _remember(user_id, user_data)
+    save_user_data(user_data)
 
 
 async def create_user_data(user_id):
     """
     Erstellt ein Nutzerdatenobjekt
     """
-    global USER_DATA
-    if not user_id in USER_DATA:
-        USER_DATA[user_id] = dict()
-    USER_DATA[user_id]["user_id"] = user_id
     await reset_history(user_id)
-
@@ -14,12 +14,15 @@ class UserIDManager:
     def __init__(self, db_name='database/telegram-users.sqlite'):
         self.db_name = db_name
         self.conn = None
+        # Alle Nutzer im Speicher - wird beim Verbinden geladen und bei jedem add_user aktualisiert
+        self.users = set()
 
     async def connect(self):
         try:
             logger.info(f"Connecting to database: {self.db_name}")
             self.conn = await aiosqlite.connect(self.db_name)
             await self._create_table()
+            await self._load_users()
         except aiosqlite.Error as e:
             logger.error(f"Failed to connect to database: {e}")
             raise
@@ -34,24 +37,27 @@ class UserIDManager:
             logger.error(f"Failed to create table: {e}")
             raise
 
+    async def _load_users(self):
+        try:
+            async with self.conn.execute('SELECT id FROM users') as cursor:
+                rows = await cursor.fetchall()
+            self.users = {row[0] for row in rows}
+            logger.info(f"Loaded {len(self.users)} users")
+        except aiosqlite.Error as e:
+            logger.error(f"Failed to load users: {e}")
+            raise
+
     async def add_user(self, user_id):
         try:
             async with self.conn.execute('INSERT OR IGNORE INTO users (id) VALUES (?)', (user_id,)) as cursor:
                 await self.conn.commit()
+            self.users.add(user_id)
             logger.info(f"User {user_id} added")
         except aiosqlite.Error as e:
             logger.error(f"Failed to add user: {e}")
 
     async def get_all_users(self):
-        try:
-            async with self.conn.execute('SELECT id FROM users') as cursor:
-                rows = await cursor.fetchall()
-                user_ids = [row[0] for row in rows]
-            logger.info(f"Fetched {len(user_ids)} users")
-            return user_ids
-        except aiosqlite.Error as e:
-            logger.error(f"Failed to fetch users: {e}")
-            return []
+        return list(self.users)
 
     async def shutdown(self):
         try:
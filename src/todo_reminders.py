@@ -0,0 +1,53 @@
+"""
+Erinnerungen zu Todos: pro offenem Todo mit Fälligkeitsdatum ein einmaliger Job im Scheduler.
+Die Todo-Tools melden neue und geänderte Todos über schedule_reminder bzw. cancel_reminder;
+solange kein Scheduler läuft (z.B. in Benchmarks), passiert dabei nichts.
+"""
+
+import logging, datetime
+import pytz
+
+from apscheduler.triggers.date import DateTrigger
+
+
+TIMEZONE = pytz.timezone("Europe/Berlin")
+
+_scheduler = None
+_fire = None  # async fire(todo_id), wird zum Fälligkeitszeitpunkt aufgerufen
+
+
+def init_reminders(scheduler, fire):
+    global _scheduler, _fire
+    _scheduler = scheduler
+    _fire = fire
+
+
+def _job_id(todo_id):
+    return f"todo-reminder-{todo_id}"
+
+
+def cancel_reminder(todo_id):
+    if _scheduler is None:
+        return
+    job = _scheduler.get_job(_job_id(todo_id))
+    if job is not None:
+        job.remove()
+        logging.info(f"Reminder for todo {todo_id} cancelled")
+
+
+def schedule_reminder(todo):
+    """Plant die Erinnerung zum Fälligkeitsdatum (neu); erledigte oder bereits gemeldete Todos werden entfernt."""
+    if _scheduler is None:
+        return
+    if todo.is_done or todo.notified or todo.due_date is None:
+        cancel_reminder(todo.id)
+        return
+
+    due_date = todo.due_date if todo.due_date.tzinfo else TIMEZONE.localize(todo.due_date)
+    # Bereits überfällige, aber noch nicht gemeldete Todos sofort erinnern
+    run_date = max(due_date, datetime.datetime.now(tz=TIMEZONE))
+    _scheduler.add_job(
+        _fire, DateTrigger(run_date=run_date), args=[todo.id], id=_job_id(todo.id),
+        replace_existing=True, misfire_grace_time=None
+    )
+    logging.info(f"Reminder for todo {todo.id} scheduled at {run_date}")
@@ -1,4 +1,4 @@
-from typing import Annotated, Callable, get_type_hints, get_args, get_origin
+from typing import Annotated, Callable, Union, get_type_hints, get_args, get_origin
 import inspect
 from typing import List, Tuple
 from collections import OrderedDict
@@ -73,6 +73,20 @@ class ToolDefGenerator:
                 if origin is Annotated:
                     args = get_args(param.annotation)
                     param_type, param_desc = args
+                    # Optional[X] wird als X beschrieben
+                    if get_origin(param_type) is Union:
+                        non_none = [arg for arg in get_args(param_type) if arg is not type(None)]
+                        if len(non_none) == 1:
+                            param_type = non_none[0]
+                    # List[X] wird als Array von X beschrieben
+                    if get_origin(param_type) is list:
+                        item_type = get_args(param_type)[0] if get_args(param_type) else str
+                        params_dict[name] = {
+                            'type': "array",
+                            'items': {'type': self.type_map.get(item_type, "string")},
+                            'description': param_desc if param_desc else ""
+                        }
+                        continue
                     param_type = self.type_map.get(param_type, "string")
                 else:
                     if self.strict:
@@ -0,0 +1,89 @@
+import os, time, asyncio, logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from src.metrics import POOL_WAIT_SECONDS, POOL_QUEUED, POOL_RUNNING
+
+
+# Worker für synchrone Tools mit blockierendem I/O (z.B. Auto-API)
+TOOL_THREAD_WORKERS = int(os.getenv("TOOL_THREAD_WORKERS", "4"))
+# Worker für rechenintensive Tools; eigene Prozesse, damit sie den GIL nicht blockieren
+TOOL_PROCESS_WORKERS = int(os.getenv("TOOL_PROCESS_WORKERS", "1"))
+
+
+def _call(func, kwargs, submitted):
+    """Läuft im Worker: misst die Wartezeit in der Warteschlange und ruft das Tool auf."""
+    # time.time statt perf_counter, weil der Wert auch aus einem anderen Prozess stammen kann
+    return time.time() - submitted, func(**kwargs)
+
+
+class ToolPool:
+    """
+    Begrenzter Pool für synchrone Tools, damit blockierende Aufrufe den Event-Loop nicht anhalten.
+    Der Executor wird erst beim ersten Aufruf erzeugt. Wartende und laufende Aufrufe sowie
+    die Wartezeit auf einen freien Worker werden pro Pool gemessen.
+    """
+
+    def __init__(self, name, executor_class, max_workers):
+        self.name = name
+        self.executor_class = executor_class
+        self.max_workers = max_workers
+        self.executor = None
+        self.in_flight = 0
+
+    def _get_executor(self):
+        if self.executor is None:
+            self.executor = self.executor_class(max_workers=self.max_workers)
+            logging.info(f"Started {self.name} tool pool with {self.max_workers} workers")
+        return self.executor
+
+    def _update_gauges(self):
+        # Der Executor arbeitet die Aufrufe der Reihe nach mit max_workers Workern ab
+        POOL_RUNNING.set(min(self.in_flight, self.max_workers), self.name)
+        POOL_QUEUED.set(max(0, self.in_flight - self.max_workers), self.name)
+
+    def submit(self, func, kwargs, on_done=None):
+        """
+        Startet den Aufruf und liefert ein asyncio-Future mit (Wartezeit, Ergebnis).
+        Die Zähler und on_done hängen am Future des Executors: sie laufen erst, wenn der Worker wirklich
+        fertig ist - auch wenn das Warten vorher per Timeout abgebrochen wurde.
+        """
+        loop = asyncio.get_running_loop()
+        future = self._get_executor().submit(_call, func, kwargs, time.time())
+        self.in_flight += 1
+        self._update_gauges()
+
+        def finished(done):
+            self.in_flight -= 1
+            self._update_gauges()
+            if not done.cancelled() and done.exception() is None:
+                POOL_WAIT_SECONDS.observe(done.result()[0], self.name)
+            if on_done is not None:
+                on_done()
+
+        def schedule_finished(done):
+            # Läuft im Worker-Thread; die Zähler gehören dem Event-Loop
+            try:
+                loop.call_soon_threadsafe(finished, done)
+            except RuntimeError:
+                pass  # Event-Loop bereits geschlossen
+
+        future.add_done_callback(schedule_finished)
+        return asyncio.wrap_future(future)
+
+    async def run(self, func, kwargs):
+        _, result = await self.submit(func, kwargs)
+        return result
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+THREAD_POOL = ToolPool("thread", ThreadPoolExecutor, TOOL_THREAD_WORKERS)
+PROCESS_POOL = ToolPool("process", ProcessPoolExecutor, TOOL_PROCESS_WORKERS)
+
+
+def shutdown_pools():
+    THREAD_POOL.shutdown()
+    PROCESS_POOL.shutdown()
@@ -0,0 +1,172 @@
+import os, re, math, logging
+from collections import Counter
+
+
+
+# Tool-Auswahl per Prompt ein-/ausschalten
+TOOL_SELECTION = os.getenv("TOOL_SELECTION", "True") == "True"
+# Anzahl der Tools, die pro Prompt maximal ausgewählt werden (zzgl. bereits genutzter Tools)
+TOOL_TOP_K = int(os.getenv("TOOL_TOP_K", "6"))
+# Unterhalb dieses BM25-Scores ist die Auswahl zu unsicher - dann werden alle Tools gesendet
+TOOL_MIN_SCORE = float(os.getenv("TOOL_MIN_SCORE", "1.0"))
+
+# BM25-Parameter
+K1 = 1.2
+B = 0.75
+# Ab dieser Länge gelten Präfixe als Treffer ("müll" findet "müllabfuhr", "wettervorhersage" findet "wetter")
+MIN_PREFIX_LENGTH = 4
+# Wortformen mit gemeinsamem Stamm dieser Länge, die sich nur in der Endung unterscheiden, gelten ebenfalls
+# als Treffer ("erinnere" findet "erinnern", "einkaufen" findet "einkaufsliste")
+MIN_STEM_LENGTH = 5
+MAX_SUFFIX_LENGTH = 3
+# Endungen kleingeschriebener Wörter, die auf ein Verb hindeuten (Infinitiv, z.B. "abholen", "einschalten")
+VERB_ENDINGS = ("en", "ern", "eln")
+
+STOPWORDS = {
+    "der", "die", "das", "und", "oder", "ist", "sind", "wie", "was", "wer", "wann", "wird", "werden",
+    "ein", "eine", "einen", "mir", "mich", "bitte", "mal", "noch", "für", "mit", "von", "den", "dem",
+    "welche", "welcher", "welches", "gibt", "hat", "hast", "haben", "habe", "kann", "kannst", "können",
+    "soll", "sollte", "muss", "bin", "bist", "sein", "uns", "dir", "dich",
+    "the", "and", "for", "with", "this", "that", "are", "will", "return", "returns", "list", "given",
+}
+
+
+def tokenize(text):
+    """Zerlegt Text (inkl. snake_case-Namen) in kleingeschriebene Terme ohne Stoppwörter."""
+    tokens = re.findall(r"[^\W\d_]+", text.lower())
+    return [token for token in tokens if len(token) > 2 and token not in STOPWORDS]
+
+
+def common_prefix_length(a, b):
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+def shares_stem(a, b):
+    """Gleicher Wortstamm, nur die Endungen unterscheiden sich (einfache Flexion)."""
+    stem = common_prefix_length(a, b)
+    return stem >= MIN_STEM_LENGTH and stem >= min(len(a), len(b)) - MAX_SUFFIX_LENGTH
+
+
+def verb_terms(text):
+    """
+    Terme, die vermutlich Verben sind: das erste Wort (Imperativ oder Frage, z.B. "Erinnere mich ...")
+    und kleingeschriebene Wörter mit Infinitiv-Endung - Substantive sind im Deutschen großgeschrieben.
+    """
+    words = re.findall(r"[^\W\d_]+", text)
+    terms = set()
+    for position, word in enumerate(words):
+        if position == 0 or (word.islower() and word.endswith(VERB_ENDINGS)):
+            terms.update(tokenize(word))
+    return terms
+
+
+def _tool_text(tool):
+    function = tool.schema["function"]
+    parts = [tool.name.replace("_", " "), function.get("description", ""), tool.keywords]
+    for param in function.get("parameters", {}).get("properties", {}).values():
+        parts.append(param.get("description", ""))
+    return " ".join(parts)
+
+
+class ToolIndex:
+    """
+    Lokaler BM25-Index über Namen, Beschreibungen und Schlüsselwörter der Tools.
+    Query-Terme treffen auch Dokument-Terme, mit denen sie ein Präfix (deutsche Komposita)
+    oder einen Wortstamm (andere Wortform) teilen.
+    """
+
+    def __init__(self, toolbox):
+        self.names = [tool.name for tool in toolbox]
+        self.term_freqs = [Counter(tokenize(_tool_text(tool))) for tool in toolbox]
+        self.doc_lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+        self.vocabulary = set().union(*self.term_freqs) if self.term_freqs else set()
+        self._matches = dict()
+
+    def _matching_terms(self, term):
+        if term not in self._matches:
+            if len(term) < MIN_PREFIX_LENGTH:
+                matches = {term} & self.vocabulary
+            else:
+                matches = {
+                    v for v in self.vocabulary
+                    if len(v) >= MIN_PREFIX_LENGTH and (v.startswith(term) or term.startswith(v) or shares_stem(v, term))
+                }
+            self._matches[term] = matches
+        return self._matches[term]
+
+    def score(self, query):
+        """Liefert den BM25-Score jedes Tools für den Query-Text."""
+        scores = [0.0] * len(self.names)
+        n = len(self.names)
+        for term in set(tokenize(query)):
+            matches = self._matching_terms(term)
+            if not matches:
+                continue
+            tfs = [sum(tf[m] for m in matches) for tf in self.term_freqs]
+            df = sum(1 for tf in tfs if tf > 0)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for i, tf in enumerate(tfs):
+                if tf:
+                    norm = K1 * (1 - B + B * self.doc_lengths[i] / self.avg_length)
+                    scores[i] += idf * tf * (K1 + 1) / (tf + norm)
+        return dict(zip(self.names, scores))
+
+
+_INDEX = None
+_INDEX_KEY = None
+
+
+def get_index(toolbox):
+    """Baut den Index einmalig bzw. neu, wenn sich die Toolbox verändert hat."""
+    global _INDEX, _INDEX_KEY
+    key = (id(toolbox), len(toolbox))
+    if _INDEX is None or _INDEX_KEY != key:
+        _INDEX = ToolIndex(toolbox)
+        _INDEX_KEY = key
+    return _INDEX
+
+
+def used_tool_names(chat_history):
+    """Namen der Tools, die im bisherigen Gesprächsverlauf bereits aufgerufen wurden."""
+    names = set()
+    for message in chat_history:
+        if isinstance(message, dict):
+            if message.get("role") == "tool" and message.get("name"):
+                names.add(message["name"])
+        else:
+            for tc in getattr(message, "tool_calls", None) or []:
+                names.add(tc.function.name)
+    return names
+
+
+def select_tools(prompt, chat_history, toolbox, top_k=TOOL_TOP_K, min_score=TOOL_MIN_SCORE):
+    """
+    Wählt die für den Prompt relevanten Tool-Schemas aus.
+    Bereits genutzte Tools bleiben enthalten. Bei zu geringer Trefferqualität oder wenn ein Verb des Prompts
+    zu keinem Tool passt (die Aktion ist dann womöglich nicht abgedeckt), werden alle Tools geliefert.
+    """
+    all_tools = toolbox.schemas
+    if not TOOL_SELECTION or len(toolbox) <= top_k:
+        return all_tools
+
+    index = get_index(toolbox)
+    scores = index.score(prompt)
+    ranked = sorted((name for name in scores if scores[name] > 0), key=lambda name: -scores[name])
+    if not ranked or scores[ranked[0]] < min_score:
+        logging.info("Tool selection not confident, sending all tools")
+        return all_tools
+    unmatched = sorted(term for term in verb_terms(prompt) if not index._matching_terms(term))
+    if unmatched:
+        logging.info(f"No tool matches the verbs {unmatched}, sending all tools")
+        return all_tools
+
+    selected = set(ranked[:top_k]) | used_tool_names(chat_history)
+    logging.info(f"Selected tools: {sorted(selected)}")
+    # Feste, nach Namen sortierte Reihenfolge der Toolbox beibehalten
+    return [tool.schema for tool in toolbox if tool.name in selected]
@@ -1,20 +1,535 @@
-import logging
+import os, json, time, asyncio, logging, functools, inspect, importlib, threading
+from collections import OrderedDict, Counter
+from typing import Annotated, Union, get_args, get_origin
 from src.toolbox.tool_def_generator import ToolDefGenerator
+from src.metrics import TOOL_SECONDS
+from src.toolbox.tool_pools import THREAD_POOL, PROCESS_POOL
 
-TOOLBOX = []
+# Standardwerte für Timeout und Circuit Breaker, falls ein Tool nichts anderes deklariert
+DEFAULT_TOOL_TIMEOUT = float(os.getenv("DEFAULT_TOOL_TIMEOUT", "20"))
+DEFAULT_FAILURE_THRESHOLD = int(os.getenv("DEFAULT_FAILURE_THRESHOLD", "3"))
+DEFAULT_RESET_TIMEOUT = float(os.getenv("DEFAULT_RESET_TIMEOUT", "60"))
 
-def register_tool_decorator(tool):
+# Maximale Anzahl an Einträgen im Tool-Cache, danach wird der am längsten nicht genutzte Eintrag verworfen
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "256"))
+
+
+class ToolCache:
+    """
+    TTL-Cache für Tool-Ergebnisse mit LRU-Verdrängung, geschlüsselt nach Tool-Name und Argumenten.
+
+    Gleichzeitige identische Aufrufe asynchroner Tools teilen sich einen einzigen Abruf (single-flight).
+    Fehler werden nicht gecacht. Treffer, Fehlschläge und geteilte Abrufe werden pro Tool gezählt.
+    """
+
+    def __init__(self, max_entries=TOOL_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.in_flight = dict()       # key -> asyncio.Future
+        self.hits = Counter()
+        self.misses = Counter()
+        self.shared = Counter()
+
+    @staticmethod
+    def make_key(name, args, kwargs):
+        return name, json.dumps([args, kwargs], sort_keys=True, default=str)
+
+    def lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return False, None
+        self.entries.move_to_end(key)
+        return True, value
+
+    def store(self, key, ttl, value):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, name):
+        """Verwirft alle Einträge eines Tools, z.B. nachdem ein Tool den Zustand verändert hat."""
+        for key in [key for key in self.entries if key[0] == name]:
+            del self.entries[key]
+
+    async def get_or_call_async(self, name, ttl, func, args, kwargs):
+        key = self.make_key(name, args, kwargs)
+        found, value = self.lookup(key)
+        if found:
+            self.hits[name] += 1
+            return value
+
+        if key in self.in_flight:
+            self.shared[name] += 1
+            return await asyncio.shield(self.in_flight[key])
+
+        self.misses[name] += 1
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            value = await func(*args, **kwargs)
+            self.store(key, ttl, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            # Mitwartende bekommen einen normalen Fehler - ein CancelledError würde ihren ganzen Turn abbrechen
+            future.set_exception(ToolUnavailableError(f"Device unavailable: {name} was cancelled, try again later."))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Exception abrufen, damit sie bei fehlenden Mitwartenden nicht als "never retrieved" geloggt wird
+            future.exception()
+            raise
+        finally:
+            del self.in_flight[key]
+
+    def get_or_call(self, name, ttl, func, args, kwargs):
+        key = self.make_key(name, args, kwargs)
+        found, value = self.lookup(key)
+        if found:
+            self.hits[name] += 1
+            return value
+        self.misses[name] += 1
+        value = func(*args, **kwargs)
+        self.store(key, ttl, value)
+        return value
+
+    def stats(self):
+        """Zähler pro Tool, um die TTLs abstimmen zu können."""
+        names = set(self.hits) | set(self.misses) | set(self.shared)
+        return {
+            name: {"hits": self.hits[name], "misses": self.misses[name], "shared": self.shared[name]}
+            for name in sorted(names)
+        }
+
+
+TOOL_CACHE = ToolCache()
+
+
+def cached(ttl, name=None):
+    """Dekorator, der die Ergebnisse einer (a)synchronen Funktion für ttl Sekunden im TOOL_CACHE hält."""
+
+    def decorator(func):
+        cache_name = name or func.__name__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await TOOL_CACHE.get_or_call_async(cache_name, ttl, func, args, kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return TOOL_CACHE.get_or_call(cache_name, ttl, func, args, kwargs)
+        return wrapper
+
+    return decorator
+
+
+def get_cache_stats():
+    return TOOL_CACHE.stats()
+
+
+class ToolArgumentError(ValueError):
+    """Ungültige Tool-Argumente - die Meldung ist kompakt und für das Modell lesbar."""
+    pass
+
+
+def unwrap_optional(annotation):
+    """Liefert (Basistyp, optional) für Annotated[Optional[X], ...] bzw. Optional[X]."""
+    if get_origin(annotation) is Annotated:
+        annotation = get_args(annotation)[0]
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0], True
+    return annotation, False
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ("true", "1", "yes", "ja"):
+        return True
+    if isinstance(value, str) and value.strip().lower() in ("false", "0", "no", "nein"):
+        return False
+    raise ValueError(value)
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return int(value.strip())
+    raise ValueError(value)
+
+
+def _to_float(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return float(value.strip())
+    raise ValueError(value)
+
+
+def _to_str(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+# Basistyp -> (Konverter, Typname für Fehlermeldungen)
+CONVERTERS = {
+    bool: (_to_bool, "boolean"),
+    int: (_to_int, "integer"),
+    float: (_to_float, "number"),
+    str: (_to_str, "string"),
+}
+
+
+def list_converter(item_type):
+    """Konverter für List[X]: jedes Element wie X; ein JSON-Array als String wird ebenfalls akzeptiert."""
+    convert_item, item_name = CONVERTERS.get(item_type, (lambda value: value, "any"))
+
+    def convert(value):
+        if isinstance(value, str):
+            value = json.loads(value)
+        if not isinstance(value, list):
+            raise ValueError(value)
+        return [convert_item(item) for item in value]
+
+    return convert, f"array of {item_name}"
+
+
+# Fehler, die auf ein nicht erreichbares Gerät hindeuten; requests.RequestException ist ein OSError.
+# Andere Exceptions (z.B. ungültige Eingaben) sagen nichts über das Gerät aus und öffnen den Breaker nicht.
+DEVICE_ERRORS = (OSError, TimeoutError, asyncio.TimeoutError)
+
+
+class ToolUnavailableError(Exception):
+    """Das Tool bzw. Gerät ist gerade nicht erreichbar (Circuit Breaker offen oder Timeout)."""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Öffnet nach failure_threshold aufeinanderfolgenden Fehlern und lehnt Aufrufe dann sofort ab.
+    Nach reset_timeout Sekunden wird ein Probeaufruf zugelassen; gelingt er, schließt der Breaker wieder.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_running:
+            self.trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_running = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class Tool:
+    """
+    Ein registriertes Tool: Funktion, Schema und ein beim Registrieren vorkompilierter Argument-Konverter,
+    sowie Timeout, Begrenzung gleichzeitiger Aufrufe und - für Tools, die ein Gerät ansprechen - Circuit Breaker.
+    Synchrone Tools laufen im Thread-Pool, als rechenintensiv markierte (cpu_bound) im Prozess-Pool.
+    """
+
+    def __init__(self, func, schema, keywords=None, timeout=DEFAULT_TOOL_TIMEOUT, max_concurrency=None,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT, cpu_bound=False,
+                 circuit_breaker=False):
+        self.name = func.__name__
+        self.module = func.__module__
+        self.func = func
+        self.schema = schema
+        self.keywords = keywords or ""
+        self.is_async = asyncio.iscoroutinefunction(func)
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout) if circuit_breaker else None
+        self.pool = None if self.is_async else (PROCESS_POOL if cpu_bound else THREAD_POOL)
+
+        # (name, converter, typname, optional, required) pro Parameter aus der Annotated-Signatur
+        self.params = []
+        for name, param in inspect.signature(func).parameters.items():
+            base_type, optional = unwrap_optional(param.annotation)
+            if get_origin(base_type) is list:
+                convert, type_name = list_converter(get_args(base_type)[0] if get_args(base_type) else str)
+            else:
+                convert, type_name = CONVERTERS.get(base_type, (lambda value: value, "any"))
+            has_default = param.default is not inspect.Parameter.empty
+            self.params.append((
+                name,
+                convert,
+                type_name,
+                optional or (has_default and param.default is None),
+                not has_default,
+            ))
+        self.param_names = {param[0] for param in self.params}
+
+    def coerce(self, arguments):
+        """Prüft die Argumente des Modells und wandelt sie in die annotierten Typen um."""
+        errors = [f"unexpected argument '{name}'" for name in arguments if name not in self.param_names]
+        result = dict()
+        for name, convert, type_name, optional, required in self.params:
+            if name not in arguments:
+                if required:
+                    errors.append(f"missing argument '{name}'")
+                continue
+            value = arguments[name]
+            if value is None or (value == "" and optional and type_name != "string"):
+                if optional:
+                    result[name] = None
+                else:
+                    errors.append(f"'{name}' must not be null")
+                continue
+            try:
+                result[name] = convert(value)
+            except (ValueError, TypeError):
+                errors.append(f"'{name}' expected {type_name}, got {json.dumps(value, default=str)}")
+        if errors:
+            raise ToolArgumentError(f"Invalid arguments for {self.name}: " + "; ".join(errors))
+        return result
+
+    async def invoke(self, arguments):
+        """
+        Prüft die Argumente und ruft das Tool mit Timeout, Nebenläufigkeitslimit und Circuit Breaker auf.
+        Bei synchronen Tools bricht der Timeout nur das Warten ab, der Worker läuft bis zum Ende weiter.
+        """
+        arguments = self.coerce(arguments)
+        started = time.perf_counter()
+        try:
+            return await self._invoke(arguments)
+        finally:
+            TOOL_SECONDS.observe(time.perf_counter() - started, self.name)
+
+    async def _invoke(self, arguments):
+        breaker = self.breaker
+        if breaker is not None and not breaker.allow():
+            raise ToolUnavailableError(f"Device unavailable: {self.name} failed repeatedly and is paused, try again later.")
+
+        try:
+            if self.semaphore is None or not self.is_async:
+                result = await self._run(arguments)
+            else:
+                async with self.semaphore:
+                    result = await self._run(arguments)
+        except asyncio.TimeoutError:
+            if breaker is not None:
+                breaker.record_failure()
+            raise ToolUnavailableError(f"Device unavailable: {self.name} did not answer within {self.timeout:g} seconds.")
+        except DEVICE_ERRORS:
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        except BaseException:
+            # Abbruch oder ein Fehler, der nichts über das Gerät aussagt - ein Probeaufruf darf erneut stattfinden
+            if breaker is not None:
+                breaker.trial_running = False
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+    async def _run(self, arguments):
+        if self.is_async:
+            return await asyncio.wait_for(self.func(**arguments), timeout=self.timeout)
+        # Ein Worker läuft nach einem Timeout weiter - der Platz im Semaphor wird erst frei, wenn er fertig ist
+        on_done = None
+        if self.semaphore is not None:
+            await self.semaphore.acquire()
+            on_done = self.semaphore.release
+        try:
+            future = self.pool.submit(self.func, arguments, on_done)
+        except BaseException:
+            if on_done is not None:
+                on_done()
+            raise
+        _, result = await asyncio.wait_for(future, timeout=self.timeout)
+        return result
+
+
+class LazyTool:
+    """
+    Platzhalter für ein Tool aus dem Manifest: Name, Schema und Keywords sind bekannt, das Modul
+    wird aber erst beim ersten Aufruf importiert. Dabei registriert sich das echte Tool und
+    ersetzt den Platzhalter in der Registry; dieser und alle weiteren Aufrufe gehen an das echte Tool.
+    """
+
+    def __init__(self, name, module, schema, keywords, registry):
+        self.name = name
+        self.module = module
+        self.schema = schema
+        self.keywords = keywords or ""
+        self.registry = registry
+
+    async def load(self):
+        try:
+            await self.registry.import_module(self.module)
+        except Exception as e:
+            logging.error(f"Failed to import tool module {self.module}: {e}")
+            raise ToolUnavailableError(f"Device unavailable: {self.name} could not be loaded.")
+        tool = self.registry.get(self.name)
+        if tool is None or isinstance(tool, LazyTool):
+            raise ToolUnavailableError(f"Device unavailable: {self.name} is no longer provided by {self.module}.")
+        logging.info(f"Loaded tool module {self.module} for {self.name}")
+        return tool
+
+    async def invoke(self, arguments):
+        tool = await self.load()
+        return await tool.invoke(arguments)
+
+
+class ToolRegistry:
+    """
+    Registry aller Tools mit O(1)-Zugriff über den Namen und gecachter Schema-Liste für die API.
+    Iteriert nach Namen sortiert über die Tool-Objekte - unabhängig von der Importreihenfolge der Module,
+    damit die Tool-Liste im Prompt zwischen Sessions und Neustarts byte-identisch bleibt.
+    """
+
+    def __init__(self):
+        self.tools = dict()
+        self._ordered = None
+        self._schemas = None
+        self._imports = dict()  # Modulname -> Task, der das Modul gerade importiert
+        self._local = threading.local()
+
+    def register(self, tool):
+        """Registriert ein Tool; ein Platzhalter aus dem Manifest wird dabei durch das echte Tool ersetzt."""
+        collected = getattr(self._local, "collected", None)
+        if collected is not None:
+            # Import im Worker-Thread: nur vormerken, die Registry ändert sich ausschließlich auf dem Event-Loop
+            collected.append(tool)
+            return True
+        if tool.name in self.tools and not isinstance(self.tools[tool.name], LazyTool):
+            return False
+        self.tools[tool.name] = tool
+        self._ordered = None
+        self._schemas = None
+        return True
+
+    def get(self, name):
+        return self.tools.get(name)
+
+    def _import_collecting(self, module):
+        self._local.collected = collected = []
+        try:
+            importlib.import_module(module)
+        finally:
+            del self._local.collected
+        return collected
+
+    async def _import_module(self, module):
+        # Import im Worker-Thread, damit schwere Abhängigkeiten den Event-Loop nicht anhalten
+        for tool in await asyncio.to_thread(self._import_collecting, module):
+            self.register(tool)
+
+    async def import_module(self, module):
+        """
+        Importiert ein Tool-Modul im Worker-Thread und registriert dessen Tools danach auf dem Event-Loop.
+        Gleichzeitige Ladevorgänge desselben Moduls teilen sich den Import.
+        """
+        task = self._imports.get(module)
+        if task is None:
+            task = self._imports[module] = asyncio.create_task(self._import_module(module))
+
+            def forget_failed(task):
+                # Nach einem Fehler darf der nächste Aufruf es erneut versuchen
+                if task.cancelled() or task.exception() is not None:
+                    self._imports.pop(module, None)
+            task.add_done_callback(forget_failed)
+        await asyncio.shield(task)
+
+    @property
+    def ordered(self):
+        if self._ordered is None:
+            self._ordered = [self.tools[name] for name in sorted(self.tools)]
+        return self._ordered
+
+    @property
+    def schemas(self):
+        if self._schemas is None:
+            self._schemas = [tool.schema for tool in self.ordered]
+        return self._schemas
+
+    def __contains__(self, name):
+        return name in self.tools
+
+    def __iter__(self):
+        return iter(self.ordered)
+
+    def __len__(self):
+        return len(self.tools)
+
+
+TOOLBOX = ToolRegistry()
+
+
+def register_tool_decorator(tool=None, *, cache_ttl=None, keywords=None, timeout=DEFAULT_TOOL_TIMEOUT,
+                            max_concurrency=None, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                            reset_timeout=DEFAULT_RESET_TIMEOUT, cpu_bound=False, circuit_breaker=False):
+    """
+    Registriert eine Funktion als Tool in der globalen TOOLBOX.
+    Verwendbar als @register_tool_decorator oder mit Optionen, z.B. @register_tool_decorator(cache_ttl=600).
+    keywords sind zusätzliche Suchbegriffe für die Tool-Auswahl pro Prompt.
+    timeout und max_concurrency steuern Timeout und Nebenläufigkeit des Tools. Tools, die ein Gerät ansprechen,
+    schalten mit circuit_breaker=True den Circuit Breaker ein (failure_threshold, reset_timeout); er zählt
+    nur Timeouts und Verbindungsfehler. Synchrone Tools laufen im Thread-Pool, mit cpu_bound=True im Prozess-Pool.
+    """
 
     def wrapper(func):
         global TOOLBOX
 
-        # Check if the function is already registered in the global toolbox
-        already_registered = next((True for (name, _, _) in TOOLBOX if name == func.__name__), False)
-        
-        if not already_registered:
+        if cache_ttl is not None:
+            func = cached(cache_ttl)(func)
+
+        if not isinstance(TOOLBOX.get(func.__name__), Tool):
             logging.info("Putting into toolbox: " + func.__name__)
             generator = ToolDefGenerator()
-            TOOLBOX.append((func.__name__, generator.generate(func)[0], func))
+            TOOLBOX.register(Tool(func, generator.generate(func)[0], keywords, timeout, max_concurrency,
+                                  failure_threshold, reset_timeout, cpu_bound, circuit_breaker))
         return func
-    
+
+    if tool is None:
+        return wrapper
     return wrapper(tool)
@@ -1,8 +1,9 @@
-import inspect
-import importlib
 import os
-import glob
 import sys
+import glob
+import json
+import logging
+import importlib
 
 
 # Aktuellen Verzeichnis-Pfad zur sys.path hinzufügen
@@ -10,19 +11,93 @@ current_dir = os.path.dirname(__file__)
 if current_dir not in sys.path:
     sys.path.append(current_dir)
 
-# Alle Python-Dateien im aktuellen Verzeichnis finden
-modules = glob.glob(os.path.join(os.path.dirname(__file__), "*.py"))
-
-# Alle Module importieren und dekorierte Funktionen in __all__ aufnehmen
 __all__ = []
-for module in modules:
-    if os.path.isfile(module) and not module.endswith('__init__.py'):
-        module_name = os.path.basename(module)[:-3]
-        try:
-            module_obj = importlib.import_module(module_name)
-            for name, obj in inspect.getmembers(module_obj):
-                if inspect.isfunction(obj) and obj.__qualname__ == "register_tool_decorator.<locals>.wrapper":
-                    __all__.append(name)
-                    globals()[name] = obj
-        except ImportError as e:
-            print(f"Fehler beim Importieren von {module_name}: {e}")
+
+# Zwischengespeicherte Schemas aller Tools; damit werden die Module erst beim ersten Aufruf importiert
+TOOL_MANIFEST = os.getenv("TOOL_MANIFEST", "database/tool_manifest.json")
+# Ändert sich die Schema-Erzeugung, ist das Manifest komplett veraltet
+MANIFEST_VERSION = 1
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _generator_fingerprint():
+    from src.toolbox import tool_def_generator
+    return [MANIFEST_VERSION] + _fingerprint(tool_def_generator.__file__)
+
+
+def _tool_modules():
+    """module_name -> Pfad aller Tool-Module in diesem Verzeichnis."""
+    modules = dict()
+    for path in sorted(glob.glob(os.path.join(current_dir, "*.py"))):
+        if os.path.isfile(path) and not path.endswith('__init__.py'):
+            modules[f"{__name__}.{os.path.basename(path)[:-3]}"] = path
+    return modules
+
+
+def _read_manifest(path):
+    try:
+        with open(path, "r") as file:
+            manifest = json.load(file)
+        if manifest.get("generator") == _generator_fingerprint():
+            return manifest["modules"]
+    except (OSError, ValueError, KeyError) as e:
+        logging.info(f"No usable tool manifest at {path}: {e}")
+    return dict()
+
+
+def _write_manifest(path, modules):
+    try:
+        with open(path, "w") as file:
+            json.dump({"generator": _generator_fingerprint(), "modules": modules}, file, ensure_ascii=False, indent=1)
+    except OSError as e:
+        logging.error(f"Failed to write tool manifest {path}: {e}")
+
+
+def _import_module(module_name):
+    try:
+        importlib.import_module(module_name)
+        return True
+    except ImportError as e:
+        print(f"Fehler beim Importieren von {module_name}: {e}")
+        return False
+
+
+def load_tools(lazy=True, manifest_path=TOOL_MANIFEST):
+    """
+    Registriert alle Tools in der TOOLBOX.
+    Mit lazy=True kommen Schema und Keywords aus dem Manifest und die Module werden erst beim ersten
+    Aufruf eines ihrer Tools importiert. Nur neue oder geänderte Module werden sofort importiert
+    und ins Manifest übernommen. Mit lazy=False werden wie bisher alle Module importiert.
+    Ein Import von src.tools allein lädt keine Tools, damit einzelne Module (z.B. im Scheduler
+    oder in Benchmarks) ohne die Seiteneffekte aller anderen nutzbar sind.
+    """
+    from src.toolbox.toolbox import TOOLBOX, LazyTool
+
+    manifest = _read_manifest(manifest_path) if lazy else dict()
+    modules = dict()
+    changed = False
+
+    for module_name, path in _tool_modules().items():
+        fingerprint = _fingerprint(path)
+        entry = manifest.get(module_name)
+        if entry is not None and entry["fingerprint"] == fingerprint:
+            modules[module_name] = entry
+            for spec in entry["tools"]:
+                TOOLBOX.register(LazyTool(spec["name"], module_name, spec["schema"], spec["keywords"], TOOLBOX))
+            continue
+
+        if not _import_module(module_name):
+            continue
+        tools = [tool for tool in TOOLBOX if tool.module == module_name]
+        modules[module_name] = {
+            "fingerprint": fingerprint,
+            "tools": [{"name": tool.name, "schema": tool.schema, "keywords": tool.keywords} for tool in tools],
+        }
+        changed = True
+
+    if lazy and (changed or modules.keys() != manifest.keys()):
+        _write_manifest(manifest_path, modules)
@@ -1,90 +1,136 @@
-import os
+import os, json, logging, threading, datetime
 from typing import Annotated, Optional
 from weconnect import weconnect
 from weconnect.elements.control_operation import ControlOperation
-import json
 
 from src.toolbox.toolbox import register_tool_decorator
+from src.car_config import CAR_REFRESH_SECONDS
 
 
 class CarApp:
-    
+    """
+    Zustand des Autos als Snapshot, der im Hintergrund regelmäßig aktualisiert wird.
+    Der Login bei WeConnect erfolgt erst beim ersten Update, Statusabfragen lesen nur den Snapshot.
+    Nur vor Steueroperationen (z.B. Klimatisierung) wird ein frisches Update erzwungen.
+    """
+
     def __init__(self):
         self.VW_USERNAME=os.getenv("VW_USER")
         self.VW_PASSWORD=os.getenv("VW_PASS")
         self.VW_VIN=os.getenv("VW_VIN")
-        self.connection = weconnect.WeConnect(username=self.VW_USERNAME, password=self.VW_PASSWORD, updateAfterLogin=False, loginOnInit=True, maxAge=600)
+        self.connection = None
+        self.capabilities_loaded = False
+        self.snapshot = None
+        self.snapshot_time = None
+        # Updates kommen aus dem Scheduler und aus dem Tool-Pool, WeConnect ist nicht threadsicher
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.connection is None:
+            logging.info("Logging in to WeConnect")
+            self.connection = weconnect.WeConnect(username=self.VW_USERNAME, password=self.VW_PASSWORD, updateAfterLogin=False, loginOnInit=True, maxAge=CAR_REFRESH_SECONDS)
+            self.capabilities_loaded = False
+        return self.connection
+
+    def _update(self, force=False, capabilities=False):
+        """Blockierendes Update bei WeConnect; muss mit gehaltenem Lock aufgerufen werden."""
+        try:
+            connection = self._connect()
+            # Capabilities ändern sich praktisch nie und werden nur nach dem Login oder auf Anfrage geladen
+            capabilities = capabilities or not self.capabilities_loaded
+            connection.update(updatePictures=False, updateCapabilities=capabilities, force=force)
+            self.capabilities_loaded = self.capabilities_loaded or capabilities
+            vehicle = connection.vehicles[self.VW_VIN]
+            self.snapshot = self._build_snapshot(vehicle)
+            self.snapshot_time = datetime.datetime.now().astimezone()
+            return vehicle
+        except Exception as e:
+            logging.error(f"WeConnect update failed: {e}")
+            # Beim nächsten Versuch neu einloggen, der letzte Snapshot bleibt erhalten
+            self.connection = None
+            # Als Verbindungsfehler melden, damit der Circuit Breaker des Tools ihn zählt
+            raise ConnectionError(f"WeConnect update failed: {e}") from e
+
+    def _build_snapshot(self, vehicle):
+        measurements = vehicle.domains["measurements"]
+        position = vehicle.domains["parking"]["parkingPosition"]
+        snapshot = dict()
+        snapshot["remaining-range-in-km"] = measurements["rangeStatus"].electricRange.value
+        snapshot["battery-capacity-in-kwh"] = 80
+        snapshot["battery-soc-in-percent"] = measurements["fuelLevelStatus"].currentSOC_pct.value
+        snapshot["odometer-in-km"] = measurements["odometerStatus"].odometer.value
+        snapshot["parking-position-link"] = "https://www.google.com/maps/?q=" + str(position.latitude.value) + "," + str(position.longitude.value)
+        control = vehicle.controls.climatizationControl
+        if control is not None and control.enabled:
+            snapshot["climatization-control"] = str(control.value)
+        return snapshot
+
+    def refresh(self, force=False):
+        """Aktualisiert den Snapshot; wird vom Scheduler regelmäßig aufgerufen."""
+        with self.lock:
+            self._update(force=force)
 
-    
     def get_car_status(self):
-        self.connection.update(updatePictures=False, updateCapabilities=False)
-        return self.connection.vehicles[self.VW_VIN]
-    
-    
+        """Liefert den letzten Snapshot; nur wenn noch keiner existiert, wird er sofort geladen."""
+        if self.snapshot is None:
+            self.refresh()
+        return self.snapshot
+
     def car_climate_control(self, activate=None):
-        print('#  update')
-        self.connection.update(updatePictures=False, updateCapabilities=True)
-
-        for vin, vehicle in self.connection.vehicles.items():
-            if vin == self.VW_VIN:
-                if "climatisation" in vehicle.domains \
-                    and "climatisationStatus" in vehicle.domains["climatisation"] \
-                    and vehicle.domains["climatisation"]["climatisationStatus"].enabled:
-                    if vehicle.domains["climatisation"]["climatisationStatus"].climatisationState.enabled:
-                        print('#  climatization status')
-                        print(vehicle.domains["climatisation"]["climatisationStatus"].climatisationState.value)
-
-                if vehicle.controls.climatizationControl is not None and vehicle.controls.climatizationControl.enabled:
-                    if activate is None:
-                        print('#  get climatization status')
-                        print(vehicle.controls.climatizationControl.value)
-                        return str(vehicle.controls.climatizationControl.value)
-                    if activate == True:
-                        print('#  start climatization')
-                        vehicle.controls.climatizationControl.value = ControlOperation.START
-                        return "Started climatization in car."
-                    else:
-                        print('#  stop climatization')
-                        vehicle.controls.climatizationControl.value = ControlOperation.STOP
-                        return "Stopped climatization in car."
-        return "No climatization control available for this car."
+        if activate is None:
+            snapshot = self.get_car_status()
+            if "climatization-control" in snapshot:
+                return snapshot["climatization-control"]
+            return "No climatization control available for this car."
+
+        with self.lock:
+            # Steueroperationen brauchen einen aktuellen Zustand der Controls
+            vehicle = self._update(force=True)
+            control = vehicle.controls.climatizationControl
+            if control is None or not control.enabled:
+                vehicle = self._update(force=True, capabilities=True)
+                control = vehicle.controls.climatizationControl
+            if control is None or not control.enabled:
+                return "No climatization control available for this car."
+
+            if activate == True:
+                logging.info("Starting climatization")
+                control.value = ControlOperation.START
+                return "Started climatization in car."
+            else:
+                logging.info("Stopping climatization")
+                control.value = ControlOperation.STOP
+                return "Stopped climatization in car."
 
 
 carApp = CarApp()
 
 
-@register_tool_decorator
+# Ohne Snapshot (direkt nach dem Start) lädt der erste Aufruf ihn selbst, inklusive Login
+@register_tool_decorator(keywords="Auto Fahrzeug Wagen Reichweite Akku Batterie Ladestand Kilometerstand parkt Parkposition Standort", timeout=60, max_concurrency=1, circuit_breaker=True)
 def get_car_status() -> Annotated[str, "Return the current status of the car as a json string."]:
     """
     Generate status object for the given car and convert it to a dictionary.
     """
     global carApp
-    status = carApp.get_car_status()
-
-    result = dict()
-    result["remaining-range-in-km"] = status.domains["measurements"]["rangeStatus"].electricRange.value
-    result["battery-capacity-in-kwh"] = 80
-    result["battery-soc-in-percent"] = status.domains["measurements"]["fuelLevelStatus"].currentSOC_pct.value
-    result["odometer-in-km"] = status.domains["measurements"]["odometerStatus"].odometer.value
-    result["parking-position-link"] = "https://www.google.com/maps/?q=" + str(status.domains["parking"]["parkingPosition"].latitude.value) + "," + str(status.domains["parking"]["parkingPosition"].longitude.value) 
+    result = dict(carApp.get_car_status())
+    result.pop("climatization-control", None)
+    result["last-update"] = carApp.snapshot_time.isoformat(timespec="minutes")
     result["system-instruction"] = "Please write a proper text summary for the car status. If possible, do not use bullet points. Instead write a short and concise flowing text that is easy to read."
     
     return json.dumps(result)
 
 
-@register_tool_decorator
+# Login und bis zu zwei erzwungene Updates bei WeConnect dauern deutlich länger als der Standard-Timeout
+@register_tool_decorator(keywords="Auto Fahrzeug Wagen Klimaanlage Klimatisierung Standklima vorheizen kühlen heizen", timeout=90, max_concurrency=1, circuit_breaker=True)
 def car_climate_control(
-    activate: Annotated[Optional[str], "Activate or deactivate the car's climate control. 'True' for activate, 'False' for deactivate. If not given, return the current status of the climate control"] = None
+    activate: Annotated[Optional[bool], "Activate or deactivate the car's climate control. true for activate, false for deactivate. If not given, return the current status of the climate control"] = None
 ) -> Annotated[str, "Returns a message that either indicates the status of the climate control. the climate control was activated or deactivated."]:
     """
     Activate or deactivate the car's climate control.
     """
     global carApp
-    if activate is None or activate == "":
-        result = carApp.car_climate_control(None)
-    else:
-        result = carApp.car_climate_control(activate == "True")
-    return result
+    return carApp.car_climate_control(activate)
 
 
 
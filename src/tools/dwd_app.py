@@ -1,44 +1,67 @@
 
 # TODO: Implement the DWD api and cache the results for 3 hours
 
-import os, datetime, logging
+import os, asyncio, datetime, logging
 from dwdwfsapi import DwdWeatherWarningsAPI
 from src.toolbox.toolbox import register_tool_decorator
 
 
 LATITUDE = os.getenv("HOME_LATITUDE")
 LONGITUDE = os.getenv("HOME_LONGITUDE")
-DWD = DwdWeatherWarningsAPI((LATITUDE, LONGITUDE))
-OLD_WARN = None
-
-
-def update_dwd_cache():
-    global DWD, LATITUDE, LONGITUDE
-
-    # update the DWD cache every 55 minutes
-    now = datetime.datetime.now(datetime.timezone.utc)
+# Der Client wird beim ersten Update erzeugt - der Konstruktor lädt bereits die Warnungen
+DWD = None
+DWD_LOCK = asyncio.Lock()
+# Fingerprints der zuletzt gemeldeten Warnungen (Schlüssel -> Warnung), None bis zur ersten Abfrage
+REPORTED_WARNINGS = None
+
+# Warnungen ab dieser Stufe werden gemeldet (1 = Wetterwarnung, 2 = markant, 3 = Unwetter, 4 = extrem)
+DWD_MIN_LEVEL = int(os.getenv("DWD_MIN_LEVEL", "2"))
+# Abfrageintervalle in Sekunden abhängig von der höchsten aktuellen oder erwarteten Warnstufe
+DWD_POLL_SECONDS = int(os.getenv("DWD_POLL_SECONDS", "3600"))
+DWD_POLL_SECONDS_WARNING = int(os.getenv("DWD_POLL_SECONDS_WARNING", "900"))
+DWD_POLL_SECONDS_SEVERE = int(os.getenv("DWD_POLL_SECONDS_SEVERE", "300"))
+
+
+def _update_sync():
+    """Blockierender HTTP-Abruf beim DWD - läuft in einem Worker-Thread."""
+    global DWD
     try:
-        if now - DWD.last_update > datetime.timedelta(minutes=55):
+        if DWD is None:
+            DWD = DwdWeatherWarningsAPI((LATITUDE, LONGITUDE))
+        else:
             DWD.update()
-    except:
-        DWD = DwdWeatherWarningsAPI((LATITUDE, LONGITUDE))
+    except Exception as e:
+        logging.error(f"DWD update failed, recreating client: {e}")
+        try:
+            DWD = DwdWeatherWarningsAPI((LATITUDE, LONGITUDE))
+        except Exception as e:
+            logging.error(f"Failed to create DWD client: {e}")
+            DWD = None
+
+
+async def update_dwd_cache(max_age=datetime.timedelta(minutes=55)):
+    """Aktualisiert die Warnungen, wenn sie älter als max_age sind, ohne den Event-Loop zu blockieren."""
+    async with DWD_LOCK:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if DWD is None or DWD.last_update is None or now - DWD.last_update > max_age:
+            await asyncio.to_thread(_update_sync)
 
     # return True if the cached data is valid
-    if not DWD.data_valid:
+    if DWD is None or not DWD.data_valid:
         return False
     return True
 
 
 from typing import Annotated
 
-@register_tool_decorator
-def get_current_warnings(
+@register_tool_decorator(keywords="Unwetter Wetterwarnung Warnung Sturm Gewitter Glätte Hitze Frost DWD Wetterdienst")
+async def get_current_warnings(
     ) -> Annotated[str, "Return the current and expected weather warnings."]:
     """
     Return the current and expected weather warnings.
     """
-    global DWD
-    update_dwd_cache()
+    if not await update_dwd_cache():
+        return ""
 
     cur_warn = "".join([str(warning) + "\n" for warning in DWD.current_warnings if warning["level"] >= 2])
     exp_warn = "".join([str(warning) + "\n" for warning in DWD.expected_warnings if warning["level"] >= 2])
@@ -49,20 +72,113 @@ def get_current_warnings(
     return ""
 
 
-def check_new_warnings():
-    global OLD_WARN
+def warning_key(warning):
+    """Identität einer Warnung: Art des Ereignisses und Beginn."""
+    return (warning["event_code"], warning["start_time"])
 
-    if OLD_WARN is None:
-        OLD_WARN = get_current_warnings()
-        return False, ""
-    
-    new_warnings = get_current_warnings()
-    if new_warnings != OLD_WARN:
-        OLD_WARN = new_warnings
-        logging.info(f"Old warnings: {OLD_WARN}\nNew warnings: {new_warnings}")
-        return True, new_warnings
-    
-    return False, ""
+
+def warning_fingerprint(warning):
+    """Was sich an einer Warnung ändern kann: Stufe und Gültigkeitszeitraum."""
+    return (warning["level"], warning["start_time"], warning["end_time"])
+
+
+def _overlaps(a, b):
+    if None in (a["start_time"], a["end_time"], b["start_time"], b["end_time"]):
+        return True
+    return a["start_time"] <= b["end_time"] and b["start_time"] <= a["end_time"]
+
+
+def current_warning_snapshot(min_level=DWD_MIN_LEVEL):
+    warnings = (DWD.current_warnings or []) + (DWD.expected_warnings or [])
+    return {warning_key(warning): warning for warning in warnings if warning["level"] >= min_level}
+
+
+def diff_warnings(old, new):
+    """
+    Vergleicht zwei Snapshots und liefert die neuen, geänderten und aufgehobenen Warnungen.
+    Eine neu ausgegebene Warnung derselben Art mit überlappendem Zeitraum gilt als geändert, nicht als neu.
+    """
+    added, changed = [], []
+    unmatched = {key: warning for key, warning in old.items() if key not in new}
+    for key, warning in new.items():
+        if key in old:
+            if warning_fingerprint(old[key]) != warning_fingerprint(warning):
+                changed.append(warning)
+            continue
+        match = next(
+            (k for k, o in unmatched.items() if o["event_code"] == warning["event_code"] and _overlaps(o, warning)),
+            None
+        )
+        if match is None:
+            added.append(warning)
+        else:
+            previous = unmatched.pop(match)
+            if warning_fingerprint(previous) != warning_fingerprint(warning):
+                changed.append(warning)
+    return {"added": added, "changed": changed, "removed": list(unmatched.values())}
+
+
+def warning_level():
+    """Höchste aktuelle oder erwartete Warnstufe."""
+    if DWD is None or not DWD.data_valid:
+        return 0
+    return max(DWD.current_warning_level or 0, DWD.expected_warning_level or 0)
+
+
+def poll_interval():
+    """Abfrageintervall in Sekunden - je höher die Warnstufe, desto häufiger."""
+    level = warning_level()
+    if level >= 3:
+        return DWD_POLL_SECONDS_SEVERE
+    if level >= 2:
+        return DWD_POLL_SECONDS_WARNING
+    return DWD_POLL_SECONDS
+
+
+async def check_warning_changes():
+    """
+    Fragt die Warnungen (höchstens so alt wie das aktuelle Intervall) ab und vergleicht sie mit den zuletzt gemeldeten.
+    Liefert (diff, snapshot); diff ist None, wenn sich nichts geändert hat. Mit acknowledge_warnings(snapshot)
+    wird der Stand als gemeldet übernommen.
+    """
+    global REPORTED_WARNINGS
+    if not await update_dwd_cache(max_age=datetime.timedelta(seconds=poll_interval() - 30)):
+        return None, None
+
+    snapshot = current_warning_snapshot()
+    if REPORTED_WARNINGS is None:
+        # Beim Start nur den Ausgangsstand merken
+        REPORTED_WARNINGS = snapshot
+        return None, snapshot
+
+    diff = diff_warnings(REPORTED_WARNINGS, snapshot)
+    if not any(diff.values()):
+        return None, snapshot
+    logging.info(
+        f"DWD warnings changed: {len(diff['added'])} added, {len(diff['changed'])} changed, {len(diff['removed'])} removed"
+    )
+    return diff, snapshot
+
+
+def acknowledge_warnings(snapshot):
+    global REPORTED_WARNINGS
+    REPORTED_WARNINGS = snapshot
+
+
+def describe_warning_changes(diff):
+    """Kurze Textform der Änderungen als Eingabe für den Prompt."""
+    def describe(warning):
+        return (
+            f"{warning['headline']} (Stufe {warning['level']}, {warning['start_time']} bis {warning['end_time']}): "
+            f"{warning['description']}"
+        )
+
+    parts = []
+    for label, key in (("Neue Warnungen", "added"), ("Geänderte Warnungen", "changed"), ("Aufgehobene Warnungen", "removed")):
+        if diff[key]:
+            parts.append(label + ":\n" + "\n".join(describe(warning) for warning in diff[key]))
+    link = os.getenv("DWD_URL")
+    return "\n\n".join(parts) + "\nFor more information visit: " + str(link)
 
 
 
@@ -74,8 +190,8 @@ if __name__ == "__main__":
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
     )
 
+    _update_sync()
     dwd = DWD
-    dwd.update()
     logging.info(f"Warncell id: {dwd.warncell_id}")
     logging.info(f"Warncell name: {dwd.warncell_name}")
     logging.info(f"Number of current warnings: {len(dwd.current_warnings)}")
@@ -97,4 +213,4 @@ if __name__ == "__main__":
 
     print()
 
-    print(get_current_warnings())
+    print(asyncio.run(get_current_warnings()))
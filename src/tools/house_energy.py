@@ -1,20 +1,29 @@
 import os, json, requests, asyncio, pytz
 from datetime import datetime
 from typing import Annotated
-from src.toolbox.toolbox import register_tool_decorator
+from src.toolbox.toolbox import register_tool_decorator, cached, TOOL_CACHE
 
 
 EVCC_URI=os.getenv("EVCC_URI")
+# Timeout für HTTP-Anfragen an EVCC in Sekunden
+EVCC_TIMEOUT = 5
 
-@register_tool_decorator
+
+@cached(ttl=10)
+async def get_evcc_state():
+    """Fragt den Zustand von EVCC ab - gemeinsam genutzt von Energie- und Wallbox-Tools."""
+    url = EVCC_URI + "/api/state"
+    response = await asyncio.to_thread(requests.get, url, timeout=EVCC_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+@register_tool_decorator(keywords="Energie Strom Verbrauch Hausverbrauch Photovoltaik Solar Batterie Akku Speicher Netz Einspeisung Leistung", timeout=10, max_concurrency=2, circuit_breaker=True)
 async def get_energy_house_data() -> Annotated[str, "The current energy data of the house."]:
     """
     Returns the current energy data of the house including current energy consumption, pv energy production, wallbox energy production and battery soc. Negative values mean that the battery is charged or power is fed to the grid.
     """
-    url = EVCC_URI + "/api/state"
-    response = await asyncio.to_thread(requests.get, url)
-    response.raise_for_status()
-    response = response.json()
+    response = await get_evcc_state()
     result = dict()
     result["battery"] = response["battery"]
     result["batteryPower"] = response["battery"][0]["power"]
@@ -29,7 +38,16 @@ async def get_energy_house_data() -> Annotated[str, "The current energy data of
     return json.dumps(result)
 
 
-@register_tool_decorator
+@cached(ttl=300)
+async def get_grid_tariff():
+    """Fragt die Strompreise bei EVCC ab - nur die Rohdaten werden gecacht, Uhrzeit und Filter gelten je Aufruf."""
+    url = EVCC_URI + "/api/tariff/grid"
+    response = await asyncio.to_thread(requests.get, url, timeout=EVCC_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+@register_tool_decorator(keywords="Strompreis Energiepreise Tarif günstig teuer Kosten Tibber Stunde", timeout=10, max_concurrency=2, circuit_breaker=True)
 async def get_energy_prices() -> Annotated[str, "A list of hourly energy prices from the grid."]:
     """ 
     Returns a list of energy prices in Euro from the grid for each hour till 12:00 today or tomorrow.
@@ -39,10 +57,7 @@ async def get_energy_prices() -> Annotated[str, "A list of hourly energy prices
     current_time = datetime.now(tz=localtz).strftime("%H:%M")
     now = datetime.now(tz=localtz)
 
-    url = EVCC_URI + "/api/tariff/grid"
-    response = await asyncio.to_thread(requests.get, url)
-    response.raise_for_status()
-    response = response.json()
+    response = await get_grid_tariff()
 
     # filter response object based on the current date and time: 
     rates = [x for x in response["rates"] if datetime.strptime(x["end"], "%Y-%m-%dT%H:%M:%S%z") >= now]
@@ -54,7 +69,7 @@ async def get_energy_prices() -> Annotated[str, "A list of hourly energy prices
     return json.dumps(response_obj)
 
 
-@register_tool_decorator
+@register_tool_decorator(keywords="Wallbox Laden Ladung Auto Modus setzen umstellen Überschuss sofort", timeout=10, max_concurrency=1, circuit_breaker=True)
 async def set_wallbox_mode(
         mode: Annotated[str, "Einer der folgenden Werte: {'off', 'pv', 'minpv', 'now'}. Dabei bedeutet 'off' das Laden deaktiviert ist, 'pv' das Laden nur mittels PV-Überschuss erfolgt, 'minpv' das Laden mit minimaler Leistung erfolgt, aber mit PV-Überschuss ergänzt wird (sofern vorhanden) und 'now' das Laden sofort mit maximaler Leistung erfolgt."] = None
     ) -> Annotated[str, "Der aktuelle Modus der Wallbox."]:
@@ -63,18 +78,17 @@ async def set_wallbox_mode(
     """
     # Wenn ein Modus übergeben wird, setzen wir diesen
     url = EVCC_URI + "/api/loadpoints/1/mode/${MODE}".replace("${MODE}", mode)
-    response = await asyncio.to_thread(requests.post, url)
+    response = await asyncio.to_thread(requests.post, url, timeout=EVCC_TIMEOUT)
+    TOOL_CACHE.invalidate("get_evcc_state")
     return json.dumps(response.json())
 
 
-@register_tool_decorator
+@register_tool_decorator(keywords="Wallbox Laden Ladung Auto Status Ladeleistung lädt", timeout=10, max_concurrency=2, circuit_breaker=True)
 async def get_wallbox_status() -> Annotated[str, "Der aktuelle Status der Wallbox."]:
     """
     Fragt den aktuellen Status der Wallbox ab. Dabei ist der Modus einer der folgenden Werte: {'off', 'pv', 'minpv', 'now'}. Dabei bedeutet 'off' das Laden deaktiviert ist, 'pv' das Laden nur mittels PV-Überschuss erfolgt, 'minpv' das Laden mit minimaler Leistung erfolgt, aber mit PV-Überschuss ergänzt wird (sofern vorhanden) und 'now' das Laden sofort mit maximaler Leistung erfolgt."
     """
-    url = EVCC_URI + "/api/state"
-    response = await asyncio.to_thread(requests.get, url)
-    r = json.loads(response.text)
+    r = await get_evcc_state()
     result_mode = r["loadpoints"][0]["mode"]
     result_charging = r["loadpoints"][0]["charging"]
     result_power = r["loadpoints"][0]["chargePower"]
@@ -83,7 +97,7 @@ async def get_wallbox_status() -> Annotated[str, "Der aktuelle Status der Wallbo
 
 WASH_URI=os.getenv("WASH_URI")
 
-@register_tool_decorator
+@register_tool_decorator(keywords="Waschmaschine Wäsche waschen fertig läuft", timeout=5, max_concurrency=1, circuit_breaker=True)
 async def get_washing_machine_status():
     """
     Returns the status of the washing machine. Can be either 'washing', 'idle' or 'off'.
@@ -101,7 +115,7 @@ async def get_washing_machine_status():
 
 DRY_URI=os.getenv("DRY_URI")
 
-@register_tool_decorator
+@register_tool_decorator(keywords="Trockner Wäsche trocknen fertig läuft", timeout=5, max_concurrency=1, circuit_breaker=True)
 async def get_dryer_machine_status():
     """
     Returns the status of the dryer. Can be either 'drying', 'idle' or 'off'.
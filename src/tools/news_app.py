@@ -198,7 +198,7 @@ class NewsReaderApp:
         return ai_response.choices[0].message.content
 
 
-@register_tool_decorator
+@register_tool_decorator(cache_ttl=1800, keywords="Nachrichten News Neuigkeiten aktuell Schlagzeilen Welt Technik", timeout=180, max_concurrency=1)
 async def get_news() -> Annotated[str, "Generates relevant news based on the user's interests."]:
     """
     Generate relevant news based on the user's interests.
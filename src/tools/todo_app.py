@@ -1,10 +1,28 @@
+import os, time, asyncio, logging
 import pytz
 from datetime import datetime
 # from pathlib import Path
-from typing import List, Optional, Dict, Annotated
+from typing import List, Optional, Dict, Tuple, Annotated
 from dataclasses import dataclass
 import aiosqlite
 from src.toolbox.toolbox import register_tool_decorator
+from src.todo_reminders import schedule_reminder, cancel_reminder
+
+
+# Fälligkeiten ohne Zeitzone sind Ortszeit; gespeichert werden sie als UTC-Epoch-Sekunden
+TIMEZONE = pytz.timezone("Europe/Berlin")
+
+
+def to_epoch(value: datetime) -> int:
+    """Convert a due date to UTC epoch seconds; naive datetimes are local time."""
+    if value.tzinfo is None:
+        value = TIMEZONE.localize(value)
+    return int(value.timestamp())
+
+
+def from_epoch(value: int) -> datetime:
+    """Convert UTC epoch seconds back to a naive local datetime, as the tools pass them in."""
+    return datetime.fromtimestamp(value, TIMEZONE).replace(tzinfo=None)
 
 @dataclass
 class Todo:
@@ -14,6 +32,7 @@ class Todo:
     category: str
     is_done: bool = False
     due_date: Optional[datetime] = None
+    notified: bool = False
     
     def __str__(self) -> str:
         return f"Todo(id={self.id}, title='{self.title}', category='{self.category}', is_done={self.is_done}, due_date={self.due_date})"
@@ -28,10 +47,22 @@ class AsyncTodoManager:
     - Category management
     - Due date tracking
     - Multi-process safe through SQLite
+    - One long-lived connection in WAL mode
     """
     
     DEFAULT_CATEGORY = "default"
     DB_FILENAME = "todos.db"
+    SCHEMA_VERSION = 2
+    CREATE_TABLE = """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            category TEXT NOT NULL,
+            is_done BOOLEAN NOT NULL DEFAULT 0,
+            due_date INTEGER,
+            notified BOOLEAN NOT NULL DEFAULT 0
+        )
+    """
     
     def __init__(self, db_path: Optional[str] = None):
         """
@@ -42,6 +73,9 @@ class AsyncTodoManager:
         """
         self.db_path = db_path or self.DB_FILENAME
         self._db: Optional[aiosqlite.Connection] = None
+        self._connect_lock = asyncio.Lock()
+        # Schreibende Operationen samt Commit nacheinander, die Verbindung wird von allen Tools geteilt
+        self._write_lock = asyncio.Lock()
         
     async def __aenter__(self):
         """Async context manager entry."""
@@ -59,20 +93,85 @@ class AsyncTodoManager:
         Raises:
             DatabaseError: If connection fails
         """
+        async with self._connect_lock:
+            if self._db is None:
+                await self._connect()
+
+    async def _connect(self) -> None:
         try:
-            self._db = await aiosqlite.connect(self.db_path)
-            await self._db.execute("""
-                CREATE TABLE IF NOT EXISTS todos (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    category TEXT NOT NULL,
-                    is_done BOOLEAN NOT NULL DEFAULT 0,
-                    due_date TIMESTAMP
-                )
-            """)
-            await self._db.commit()
+            db = await aiosqlite.connect(self.db_path)
+            # WAL: Lesen blockiert nicht das Schreiben, NORMAL spart den fsync pro Commit auf der SD-Karte
+            await db.execute("PRAGMA journal_mode=WAL")
+            await db.execute("PRAGMA synchronous=NORMAL")
+            await self._migrate(db)
+            # Erst nach der Migration für andere Aufrufe freigeben
+            self._db = db
+            logging.info(f"Connected to todo database {self.db_path}")
         except aiosqlite.Error as e:
             raise DatabaseError(f"Failed to initialize database: {str(e)}") from e
+
+    async def _migrate(self, db: aiosqlite.Connection) -> None:
+        """
+        Bring the schema to SCHEMA_VERSION, tracked in PRAGMA user_version.
+
+        Version 1: notified column for sent reminders.
+        Version 2: due_date as UTC epoch seconds (INTEGER) and indexes for open todos by due date and category.
+        """
+        async with db.execute("PRAGMA user_version") as cursor:
+            version = (await cursor.fetchone())[0]
+        if version >= self.SCHEMA_VERSION:
+            return
+
+        await db.execute("BEGIN")
+        try:
+            async with db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'todos'") as cursor:
+                exists = await cursor.fetchone() is not None
+            if not exists:
+                await db.execute(self.CREATE_TABLE.format(table="todos"))
+            else:
+                if version < 1:
+                    # Ältere Datenbanken um die Spalte für gemeldete Erinnerungen ergänzen
+                    async with db.execute("PRAGMA table_info(todos)") as cursor:
+                        columns = [row[1] for row in await cursor.fetchall()]
+                    if "notified" not in columns:
+                        await db.execute("ALTER TABLE todos ADD COLUMN notified BOOLEAN NOT NULL DEFAULT 0")
+                if version < 2:
+                    await self._migrate_epoch_due_dates(db)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_todos_open_due ON todos (is_done, due_date)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_todos_open_category ON todos (is_done, category, due_date)")
+            await db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        logging.info(f"Migrated todo database {self.db_path} from version {version} to {self.SCHEMA_VERSION}")
+
+    async def _migrate_epoch_due_dates(self, db: aiosqlite.Connection) -> None:
+        """Rebuild the table with due_date as INTEGER, converting the stored timestamps to UTC epoch seconds."""
+        await db.execute(self.CREATE_TABLE.format(table="todos_migration"))
+        async with db.execute("SELECT id, title, category, is_done, due_date, notified FROM todos") as cursor:
+            rows = await cursor.fetchall()
+        converted = []
+        for row in rows:
+            try:
+                due_date = to_epoch(datetime.fromisoformat(row[4])) if row[4] else None
+            except (TypeError, ValueError):
+                logging.warning(f"Dropping unreadable due date {row[4]!r} of todo {row[0]}")
+                due_date = None
+            converted.append((row[0], row[1], row[2], bool(row[3]), due_date, bool(row[5])))
+        await db.executemany(
+            "INSERT INTO todos_migration (id, title, category, is_done, due_date, notified) VALUES (?, ?, ?, ?, ?, ?)",
+            converted
+        )
+
+        # AUTOINCREMENT-Zähler übernehmen, damit IDs gelöschter Todos nicht neu vergeben werden
+        async with db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'todos'") as cursor:
+            row = await cursor.fetchone()
+        await db.execute("DROP TABLE todos")
+        await db.execute("ALTER TABLE todos_migration RENAME TO todos")
+        if row is not None:
+            await db.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'todos' AND seq < ?", (row[0], row[0]))
+        logging.info(f"Converted due dates of {len(converted)} todos to epoch seconds")
             
     async def close(self) -> None:
         """Close database connection if open."""
@@ -109,14 +208,15 @@ class AsyncTodoManager:
         
         await self._ensure_connected()
         try:
-            cursor = await self._db.execute(
-                """
-                INSERT INTO todos (title, category, due_date)
-                VALUES (?, ?, ?)
-                """,
-                (title, category, due_date)
-            )
-            await self._db.commit()
+            async with self._write_lock:
+                cursor = await self._db.execute(
+                    """
+                    INSERT INTO todos (title, category, due_date)
+                    VALUES (?, ?, ?)
+                    """,
+                    (title, category, to_epoch(due_date) if due_date else None)
+                )
+                await self._db.commit()
             
             return Todo(
                 id=cursor.lastrowid,
@@ -209,9 +309,6 @@ class AsyncTodoManager:
         Raises:
             DatabaseError: If database operation fails
         """
-        tz = pytz.timezone("Europe/Berlin")
-        current_time = datetime.now(tz)
-
         await self._ensure_connected()
         
         try:
@@ -223,7 +320,7 @@ class AsyncTodoManager:
                 AND due_date < ?
                 ORDER BY due_date
                 """,
-                (current_time,)
+                (int(time.time()),)
             ) as cursor:
                 rows = await cursor.fetchall()
                 return [await self._row_to_todo(row) for row in rows]
@@ -231,6 +328,57 @@ class AsyncTodoManager:
             raise DatabaseError(f"Failed to get overdue todos: {str(e)}") from e
 
     
+    async def get_pending_reminders(self) -> List[Todo]:
+        """
+        Get all open todos with a due date whose reminder has not been sent yet.
+        
+        Returns:
+            List of Todo objects ordered by due date
+            
+        Raises:
+            DatabaseError: If database operation fails
+        """
+        await self._ensure_connected()
+        try:
+            async with self._db.execute(
+                """
+                SELECT * FROM todos
+                WHERE is_done = 0
+                AND notified = 0
+                AND due_date IS NOT NULL
+                ORDER BY due_date
+                """
+            ) as cursor:
+                rows = await cursor.fetchall()
+                return [await self._row_to_todo(row) for row in rows]
+        except aiosqlite.Error as e:
+            raise DatabaseError(f"Failed to get pending reminders: {str(e)}") from e
+
+    async def mark_notified(self, todo_id: int) -> bool:
+        """
+        Persist that the reminder of a todo has been sent.
+        
+        Args:
+            todo_id: ID of the todo
+            
+        Returns:
+            True if an open, not yet notified todo was marked, False otherwise
+            
+        Raises:
+            DatabaseError: If database operation fails
+        """
+        await self._ensure_connected()
+        try:
+            async with self._write_lock:
+                cursor = await self._db.execute(
+                    "UPDATE todos SET notified = 1 WHERE id = ? AND is_done = 0 AND notified = 0",
+                    (todo_id,)
+                )
+                await self._db.commit()
+            return cursor.rowcount > 0
+        except aiosqlite.Error as e:
+            raise DatabaseError(f"Failed to mark todo as notified: {str(e)}") from e
+
     async def update_todo(self, todo_id: int, title: Optional[str] = None,
                         category: Optional[str] = None, is_done: Optional[bool] = None,
                         due_date: Optional[datetime] = None) -> Optional[Todo]:
@@ -272,7 +420,9 @@ class AsyncTodoManager:
             params.append(is_done)
         if due_date is not None:
             updates.append("due_date = ?")
-            params.append(due_date)
+            params.append(to_epoch(due_date))
+            # Neues Fälligkeitsdatum - die Erinnerung wird erneut fällig
+            updates.append("notified = 0")
             
         if not updates:
             return current_todo
@@ -282,12 +432,128 @@ class AsyncTodoManager:
         
         await self._ensure_connected()
         try:
-            await self._db.execute(update_query, params)
-            await self._db.commit()
+            async with self._write_lock:
+                await self._db.execute(update_query, params)
+                await self._db.commit()
             return await self.get_todo(todo_id)
         except aiosqlite.Error as e:
             raise DatabaseError(f"Failed to update todo: {str(e)}") from e
     
+    async def _rollback(self) -> None:
+        """
+        Roll back the open batch transaction. Shielded, so a cancellation (e.g. the tool timeout)
+        cannot leave the transaction open on the shared connection for the next writer.
+        """
+        await asyncio.shield(self._db.rollback())
+
+    async def add_todos(self, titles: List[str], category: Optional[str] = None,
+                        due_date: Optional[datetime] = None) -> List[Todo]:
+        """
+        Add several todos with a common category and due date in one transaction.
+        
+        Args:
+            titles: Todo titles/descriptions
+            category: Optional category (uses default if None)
+            due_date: Optional due datetime
+            
+        Returns:
+            List of created Todo items with assigned IDs
+            
+        Raises:
+            DatabaseError: If database operation fails; no todo is created then
+            ValueError: If a title is empty
+        """
+        if any(not title.strip() for title in titles):
+            raise ValueError("Todo title cannot be empty")
+            
+        category = category or self.DEFAULT_CATEGORY
+        due_epoch = to_epoch(due_date) if due_date else None
+        
+        await self._ensure_connected()
+        async with self._write_lock:
+            try:
+                await self._db.execute("BEGIN")
+                todos = []
+                for title in titles:
+                    cursor = await self._db.execute(
+                        "INSERT INTO todos (title, category, due_date) VALUES (?, ?, ?)",
+                        (title, category, due_epoch)
+                    )
+                    todos.append(Todo(id=cursor.lastrowid, title=title, category=category, due_date=due_date))
+                await self._db.commit()
+                return todos
+            except aiosqlite.Error as e:
+                await self._rollback()
+                raise DatabaseError(f"Failed to add todos: {str(e)}") from e
+            except BaseException:
+                await self._rollback()
+                raise
+
+    async def update_todos(self, todo_ids: List[int], category: Optional[str] = None,
+                           is_done: Optional[bool] = None,
+                           due_date: Optional[datetime] = None) -> Tuple[List[Todo], List[int]]:
+        """
+        Apply the same changes to several open todos in one transaction.
+        
+        Args:
+            todo_ids: IDs of todos to update
+            category: New category (if None, remains unchanged)
+            is_done: New completion status (if None, remains unchanged)
+            due_date: New due date (if None, remains unchanged)
+            
+        Returns:
+            Tuple of the updated todos and the IDs that were not found or already done
+            
+        Raises:
+            ValueError: If no field to update is given
+            DatabaseError: If database operation fails; no todo is changed then
+        """
+        updates = []
+        params = []
+        if category is not None:
+            updates.append("category = ?")
+            params.append(category)
+        if is_done is not None:
+            updates.append("is_done = ?")
+            params.append(is_done)
+        if due_date is not None:
+            updates.append("due_date = ?")
+            params.append(to_epoch(due_date))
+            # Neues Fälligkeitsdatum - die Erinnerung wird erneut fällig
+            updates.append("notified = 0")
+        if not updates:
+            raise ValueError("No fields to update")
+
+        todo_ids = list(dict.fromkeys(todo_ids))
+        placeholders = ", ".join("?" * len(todo_ids))
+        
+        await self._ensure_connected()
+        async with self._write_lock:
+            try:
+                await self._db.execute("BEGIN")
+                async with self._db.execute(
+                    f"SELECT id FROM todos WHERE is_done = 0 AND id IN ({placeholders})", todo_ids
+                ) as cursor:
+                    found = [row[0] for row in await cursor.fetchall()]
+                found_placeholders = ", ".join("?" * len(found))
+                if found:
+                    await self._db.execute(
+                        f"UPDATE todos SET {', '.join(updates)} WHERE id IN ({found_placeholders})", params + found
+                    )
+                async with self._db.execute(
+                    f"SELECT * FROM todos WHERE id IN ({found_placeholders}) ORDER BY id", found
+                ) as cursor:
+                    todos = [await self._row_to_todo(row) for row in await cursor.fetchall()]
+                await self._db.commit()
+            except aiosqlite.Error as e:
+                await self._rollback()
+                raise DatabaseError(f"Failed to update todos: {str(e)}") from e
+            except BaseException:
+                await self._rollback()
+                raise
+        missing = [todo_id for todo_id in todo_ids if todo_id not in found]
+        return todos, missing
+    
     @staticmethod
     async def _row_to_todo(row: aiosqlite.Row) -> Todo:
         """Convert a database row to a Todo object."""
@@ -296,7 +562,8 @@ class AsyncTodoManager:
             title=row[1],
             category=row[2],
             is_done=bool(row[3]),
-            due_date=datetime.fromisoformat(row[4]) if row[4] else None
+            due_date=from_epoch(row[4]) if row[4] is not None else None,
+            notified=bool(row[5])
         )
 
 
@@ -305,16 +572,20 @@ class DatabaseError(Exception):
     pass
 
 
-@register_tool_decorator
+# Gemeinsamer Manager für alle Tools und den Scheduler; verbunden wird in post_init, geschlossen in post_shutdown
+TODO_DB_PATH = os.getenv("TODO_DB_PATH", "database/todo.sqlite")
+todo_manager = AsyncTodoManager(TODO_DB_PATH)
+
+
+@register_tool_decorator(keywords="Todo Aufgaben überfällig fällig Erinnerung vergessen")
 async def get_overdue_todos() -> Annotated[str, "Return a list of overdue todos."]:
     """
     Get a list of overdue todos.
     """
-    async with AsyncTodoManager("database/todo.sqlite") as todo_manager:
-        overdue = await todo_manager.get_overdue_todos()
+    overdue = await todo_manager.get_overdue_todos()
     return str(overdue)
 
-@register_tool_decorator
+@register_tool_decorator(keywords="Todo Aufgabe erstellen anlegen hinzufügen notieren Erinnerung erinnern Einkaufsliste kaufen Liste")
 async def create_todo(
         title: Annotated[str, "The todo item title"], 
         category: Annotated[Optional[str], "The category of the todo item, 'default' if not specified."], 
@@ -324,58 +595,127 @@ async def create_todo(
     Create a new todo. Please note: You can use this to create reminder actions with a given due date.
     """
     due_date_datetime = datetime.strptime(due_date, "%Y-%m-%d %H:%M") if due_date else None
-    async with AsyncTodoManager("database/todo.sqlite") as todo_manager:
-        todo = await todo_manager.add_todo(title, category, due_date_datetime)
+    todo = await todo_manager.add_todo(title, category, due_date_datetime)
+    schedule_reminder(todo)
     return str(todo)
 
-@register_tool_decorator
+@register_tool_decorator(keywords="Todo Aufgaben Kategorien Listen")
 async def get_categories(
     ) -> Annotated[str, "Return a list of all categories with open todos."]:
     """
     Get a list of all categories.
     """
-    async with AsyncTodoManager("database/todo.sqlite") as todo_manager:
-        all_todos = await todo_manager.get_todos()
+    all_todos = await todo_manager.get_todos()
     categories = set(todo.category for todo in all_todos)
     return str(categories)
 
-@register_tool_decorator
+@register_tool_decorator(keywords="Todo Aufgaben Kategorie Liste Einkaufsliste einkaufen")
 async def get_todos_by_category(
         category: Annotated[str, "The given category"],
     ) -> Annotated[str, "Return a list of todos by category."]:
     """
     Get a list of todos by category.
     """
-    async with AsyncTodoManager("database/todo.sqlite") as todo_manager:
-        todos = await todo_manager.get_todos_by_category(category)
+    todos = await todo_manager.get_todos_by_category(category)
     return str(todos)
 
-@register_tool_decorator
+@register_tool_decorator(keywords="Todo Aufgabe ändern erledigt abhaken fertig verschieben umbenennen")
 async def update_todo(
         todo_id: Annotated[int, "The todo item id"],
         title: Annotated[Optional[str], "The modified title"] = None, 
         category: Annotated[Optional[str], "The modified category"] = None, 
-        is_done: Annotated[Optional[str], "'True', if item is done"] = None, 
+        is_done: Annotated[Optional[bool], "true, if item is done"] = None, 
         due_date: Annotated[Optional[str], "The modified due date of the todo item in format 'YYYY-MM-DD HH:MM'"] = None,
     ) -> Annotated[str, "Return the updated todo."]:
     """
     Update a todo.
     """
-    is_done = (is_done == "True" if is_done else None)
     due_date_datetime = datetime.strptime(due_date, "%Y-%m-%d %H:%M") if due_date else None
-    async with AsyncTodoManager("database/todo.sqlite") as todo_manager:
-        todo = await todo_manager.update_todo(todo_id, title, category, is_done, due_date_datetime)
+    todo = await todo_manager.update_todo(todo_id, title, category, is_done, due_date_datetime)
+    # get_todo liefert nur offene Todos - erledigte kommen als None zurück
+    if todo is None:
+        cancel_reminder(todo_id)
+    else:
+        schedule_reminder(todo)
     return str(todo)
 
 
-@register_tool_decorator
+def summarise_todos(todos: List[Todo]) -> str:
+    """Compact one-line summary of several todos for batch tool results."""
+    def describe(todo):
+        text = f"#{todo.id} {todo.title}"
+        if todo.due_date:
+            text += f" (due {todo.due_date:%Y-%m-%d %H:%M})"
+        return text + (" [done]" if todo.is_done else "")
+    return "; ".join(describe(todo) for todo in todos)
+
+
+def summarise_batch(verb: str, todos: List[Todo], missing: List[int]) -> str:
+    result = f"{verb} {len(todos)} todos"
+    if todos:
+        result += f": {summarise_todos(todos)}"
+    if missing:
+        result += f". Not found or already done: {', '.join(str(todo_id) for todo_id in missing)}"
+    return result
+
+
+def parse_due_date(due_date: Optional[str]) -> Optional[datetime]:
+    return datetime.strptime(due_date, "%Y-%m-%d %H:%M") if due_date else None
+
+
+@register_tool_decorator(keywords="Todo Aufgaben mehrere erstellen anlegen hinzufügen notieren Einkaufsliste kaufen einkaufen Liste Artikel")
+async def create_todos(
+        titles: Annotated[List[str], "The titles of the todo items, one per item"],
+        category: Annotated[Optional[str], "The category of all items, 'default' if not specified."] = None,
+        due_date: Annotated[Optional[str], "The common due date of all items in format 'YYYY-MM-DD HH:MM'"] = None,
+    ) -> Annotated[str, "Return a compact summary of the added todos."]:
+    """
+    Create several todos at once, e.g. all items of a shopping list. Use this instead of repeated create_todo calls.
+    """
+    todos = await todo_manager.add_todos(titles, category, parse_due_date(due_date))
+    for todo in todos:
+        schedule_reminder(todo)
+    return f"Added {len(todos)} todos to '{category or AsyncTodoManager.DEFAULT_CATEGORY}': {summarise_todos(todos)}"
+
+
+@register_tool_decorator(keywords="Todo Aufgaben mehrere ändern erledigt verschieben Kategorie Liste")
+async def update_todos(
+        todo_ids: Annotated[List[int], "The ids of the todo items to update"],
+        category: Annotated[Optional[str], "The modified category of all items"] = None,
+        is_done: Annotated[Optional[bool], "true, if all items are done"] = None,
+        due_date: Annotated[Optional[str], "The modified due date of all items in format 'YYYY-MM-DD HH:MM'"] = None,
+    ) -> Annotated[str, "Return a compact summary of the updated todos."]:
+    """
+    Apply the same change to several todos at once, e.g. move them to another category or postpone them.
+    """
+    if category is None and is_done is None and due_date is None:
+        return "No todos updated: pass at least one of category, is_done or due_date."
+    todos, missing = await todo_manager.update_todos(todo_ids, category, is_done, parse_due_date(due_date))
+    for todo in todos:
+        schedule_reminder(todo)
+    return summarise_batch("Updated", todos, missing)
+
+
+@register_tool_decorator(keywords="Todo Aufgaben mehrere erledigt abhaken fertig gekauft alle")
+async def complete_todos(
+        todo_ids: Annotated[List[int], "The ids of the todo items that are done"],
+    ) -> Annotated[str, "Return a compact summary of the completed todos."]:
+    """
+    Mark several todos as done at once, e.g. everything that was bought.
+    """
+    todos, missing = await todo_manager.update_todos(todo_ids, is_done=True)
+    for todo in todos:
+        cancel_reminder(todo.id)
+    return summarise_batch("Completed", todos, missing)
+
+
+@register_tool_decorator(keywords="Todo Aufgaben offen Liste anstehen")
 async def get_open_todos(
     ) -> Annotated[str, "Return a list of open todos."]:
     """
     Get a list of all open todos.
     """
-    async with AsyncTodoManager("database/todo.sqlite") as todo_manager:
-        todos = await todo_manager.get_todos()
+    todos = await todo_manager.get_todos()
     return str(todos)
 
 
@@ -1,87 +1,148 @@
 from typing import Annotated
-import datetime, ics
+import os, glob, json, bisect, asyncio, logging, datetime
 from src.toolbox.toolbox import register_tool_decorator
 
-# Get the current year
-current_year = datetime.datetime.now().year
 
-filename = "database/abfuhrtermine-" + str(current_year) + ".ics"
-with open(filename, 'r') as file:
-    data = file.read()
-calendar = ics.Calendar(data)
+# Ein Abfuhrkalender pro Jahr, alle vorhandenen Jahre werden gemeinsam indiziert
+TRASH_CALENDAR_GLOB = os.getenv("TRASH_CALENDAR_GLOB", "database/abfuhrtermine-*.ics")
+# Vorberechneter Index, damit die ICS-Dateien nur nach einer Änderung neu geparst werden
+TRASH_INDEX_CACHE = os.getenv("TRASH_INDEX_CACHE", "database/abfuhrtermine-index.json")
 
+# Teilstring im Terminnamen -> Tonne; der erste Treffer zählt
+TRASH_TYPES = [
+    ("gelb", "Gelbe Tonne"),
+    ("restmülltonne", "Restmüll"),
+    ("biotonne", "Biotonne"),
+    ("papiertonne", "Papiertonne"),
+]
 
-@register_tool_decorator
+
+class TrashIndex:
+    """
+    Abfuhrtermine als Index: pro Datum die Tonnen (für heute/morgen) und pro Tonne die sortierten Termine
+    (für die nächste Abfuhr per Binärsuche). sources hält mtime und Größe der Kalender, aus denen er gebaut wurde.
+    """
+
+    def __init__(self, sources, by_date):
+        self.sources = sources
+        self.by_date = by_date  # ISO-Datum -> Tonnen
+        self.by_type = {trash_type: [] for _, trash_type in TRASH_TYPES}  # Tonne -> sortierte Daten
+        for day in sorted(by_date):
+            for trash_type in by_date[day]:
+                self.by_type[trash_type].append(datetime.date.fromisoformat(day))
+
+    def on(self, date):
+        return self.by_date.get(date.isoformat(), [])
+
+    def next_pickups(self, date):
+        """Nächste Abfuhr ab date je Tonne, nach Datum sortiert."""
+        result = []
+        for trash_type, dates in self.by_type.items():
+            position = bisect.bisect_left(dates, date)
+            if position < len(dates):
+                result.append({"date": dates[position], "type": trash_type})
+        return sorted(result, key=lambda pickup: pickup["date"])
+
+
+def classify(name):
+    name = name.lower()
+    for marker, trash_type in TRASH_TYPES:
+        if marker in name:
+            return trash_type
+    return None
+
+
+def calendar_sources():
+    """Pfad -> [mtime_ns, Größe] aller Abfuhrkalender."""
+    sources = dict()
+    for path in sorted(glob.glob(TRASH_CALENDAR_GLOB)):
+        stat = os.stat(path)
+        sources[path] = [stat.st_mtime_ns, stat.st_size]
+    return sources
+
+
+def build_index(sources):
+    """Parst alle Kalender (langsam, ics wird nur hier gebraucht) und speichert den Index."""
+    import ics
+
+    by_date = dict()
+    for path in sources:
+        with open(path, 'r') as file:
+            calendar = ics.Calendar(file.read())
+        for event in calendar.events:
+            trash_type = classify(event.name or "")
+            if trash_type is None:
+                continue
+            types = by_date.setdefault(event.begin.date().isoformat(), [])
+            if trash_type not in types:
+                types.append(trash_type)
+    # Innerhalb eines Tages immer in derselben Reihenfolge, ics liefert die Termine als Set
+    order = [trash_type for _, trash_type in TRASH_TYPES]
+    for types in by_date.values():
+        types.sort(key=order.index)
+
+    try:
+        with open(TRASH_INDEX_CACHE, "w") as file:
+            json.dump({"sources": sources, "by_date": by_date}, file, ensure_ascii=False, separators=(",", ":"))
+    except OSError as e:
+        logging.error(f"Failed to store trash index: {e}")
+    logging.info(f"Built trash index from {len(sources)} calendars with {len(by_date)} pickup days")
+    return TrashIndex(sources, by_date)
+
+
+def load_index(sources):
+    """Index aus dem Cache, wenn er zu den aktuellen Kalendern passt, sonst neu gebaut."""
+    try:
+        with open(TRASH_INDEX_CACHE, "r") as file:
+            cached = json.load(file)
+        if cached["sources"] == sources:
+            return TrashIndex(sources, cached["by_date"])
+    except (OSError, ValueError, KeyError):
+        pass
+    return build_index(sources)
+
+
+index = None
+index_lock = asyncio.Lock()
+
+
+async def get_index():
+    """Aktueller Index; geparst wird nur, wenn sich ein Kalender geändert hat oder ein neues Jahr dazukommt."""
+    global index
+    sources = calendar_sources()
+    if index is not None and index.sources == sources:
+        return index
+    async with index_lock:
+        if index is None or index.sources != sources:
+            index = await asyncio.to_thread(load_index, sources)
+    return index
+
+
+@register_tool_decorator(keywords="Müll Mülltonne Abfuhr Müllabfuhr morgen Tonne rausstellen Gelbe Restmüll Biotonne Papiertonne")
 async def get_tomorrows_trash(
     ) -> Annotated[str, "Return a list of trash bins that will be emptied tomorrow."]:
     """
     Return a list of trash bins that is going to be emptied tomorrow.
     """
-    global calendar
     tomorrow = datetime.date.today() + datetime.timedelta(days=1)
-    trash = []
-    for event in calendar.events:
-        if event.begin.date() == tomorrow:
-            if "gelb" in event.name.lower():
-                trash.append("Gelbe Tonne")
-            elif "restmülltonne" in event.name.lower():
-                trash.append("Restmüll")
-            elif "biotonne" in event.name.lower():
-                trash.append("Biotonne")
-            elif "papiertonne" in event.name.lower():
-                trash.append("Papiertonne")
-    return str(trash)
-
-
-@register_tool_decorator
+    return str((await get_index()).on(tomorrow))
+
+
+@register_tool_decorator(keywords="Müll Mülltonne Abfuhr Müllabfuhr heute Tonne Gelbe Restmüll Biotonne Papiertonne")
 async def get_todays_trash(
     ) -> Annotated[str, "Return a list of trash bins that will be emptied today."]:
     """
     Return a list of trash bins that is going to be emptied today.
     """
-    global calendar
     today = datetime.date.today()
-    trash = []
-    for event in calendar.events:
-        if event.begin.date() == today:
-            if "gelb" in event.name.lower():
-                trash.append("Gelbe Tonne")
-            elif "restmülltonne" in event.name.lower():
-                trash.append("Restmüll")
-            elif "biotonne" in event.name.lower():
-                trash.append("Biotonne")
-            elif "papiertonne" in event.name.lower():
-                trash.append("Papiertonne")
-    return str(trash)
-
-
-@register_tool_decorator
+    return str((await get_index()).on(today))
+
+
+@register_tool_decorator(keywords="Müll Mülltonne Abfuhr Müllabfuhr nächste wann Termine Tonne Gelbe Restmüll Biotonne Papiertonne")
 async def get_next_trash(
 ) -> Annotated[str, "Return a list of trash bins and the date they will be emptied next."]:
     """
     Return a list of trash bins and the date they will be emptied next.
     """
-    global calendar
     today = datetime.date.today()
-    trash = []
-
-    # Beginning from today, search the next trash events for each type of trash bin
-    found = dict()
-    for i in range(30):
-        date = today + datetime.timedelta(days=i)
-        for event in calendar.events:
-            if event.begin.date() == date:
-                if "gelb" in event.name.lower() and not found.get("gelb", False):
-                    trash.append({"date": date, "type": "Gelbe Tonne"})
-                    found["gelb"] = True
-                elif "restmülltonne" in event.name.lower() and not found.get("restmülltonne", False):
-                    trash.append({"date": date, "type": "Restmüll"})
-                    found["restmülltonne"] = True
-                elif "biotonne" in event.name.lower() and not found.get("biotonne", False):
-                    trash.append({"date": date, "type": "Biotonne"})
-                    found["biotonne"] = True
-                elif "papiertonne" in event.name.lower() and not found.get("papiertonne", False):
-                    trash.append({"date": date, "type": "Papiertonne"})
-                    found["papiertonne"] = True
-    
-    return str(trash)
\ No newline at end of file
+    return str((await get_index()).next_pickups(today))
@@ -2,25 +2,30 @@ import os, asyncio, json
 import requests
 import datetime, pytz
 from typing import Annotated
-from src.toolbox.toolbox import register_tool_decorator
+from src.toolbox.toolbox import register_tool_decorator, cached
 
 
-@register_tool_decorator
-async def get_weather_week(
-    ) -> Annotated[str, "Return the weather forecast for the next three days."]:
-    """
-    Return weather forecast for the next three days. Data included are: temperature, weather, clouds, and wind at 3-hour interval. Additionally sunrise and sunset times are included.
-    """
+@cached(ttl=600)
+async def get_forecast():
+    """Fragt die Vorhersage bei OpenWeather ab - gecacht wird nur die Antwort, die aktuelle Uhrzeit kommt je Aufruf dazu."""
     latitude, longitude = os.getenv("HOME_LATITUDE"), os.getenv("HOME_LONGITUDE")
 
     uri = "https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={API key}&units=metric"
     uri = uri.replace("{lat}", str(latitude)).replace("{lon}", str(longitude))
     uri = uri.replace("{API key}", os.getenv("OPENWEATHER_API_KEY"))
 
-    response = await asyncio.to_thread(requests.get, uri)
+    response = await asyncio.to_thread(requests.get, uri, timeout=10)
     response.raise_for_status()
+    return response.json()
+
 
-    response = response.json()
+@register_tool_decorator(keywords="Wetter Wettervorhersage Vorhersage morgen übermorgen Woche Tage Regen Sonne Temperatur Wind Wolken Sonnenaufgang Sonnenuntergang", timeout=15)
+async def get_weather_week(
+    ) -> Annotated[str, "Return the weather forecast for the next three days."]:
+    """
+    Return weather forecast for the next three days. Data included are: temperature, weather, clouds, and wind at 3-hour interval. Additionally sunrise and sunset times are included.
+    """
+    response = await get_forecast()
 
     result = dict()
     timezone = pytz.timezone("Europe/Berlin")
@@ -47,7 +52,7 @@ async def get_weather_week(
     return json.dumps(result)
 
 
-@register_tool_decorator
+@register_tool_decorator(keywords="Wetter heute Regen Sonne Temperatur Wind Wolken Sonnenaufgang Sonnenuntergang Schirm Jacke", timeout=15)
 async def get_weather_today(
     ) -> Annotated[str, "Return the weather forecast for today."]:
     """